@@ -0,0 +1,83 @@
+import hashlib
+import os
+import re
+from pathlib import Path
+
+ASSET_SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# Source files concatenated into each bundle, in order
+ASSET_SOURCES = {
+    'js': ('map.js',),
+    'css': ('map.css',),
+}
+
+# Bundles are written here, relative to the map page
+STATIC_DIR = 'static'
+
+# Length of the content hash in bundle file names
+HASH_LENGTH = 10
+
+def minify_css(source):
+    """Strip comments and collapse whitespace in a stylesheet"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{}:;,>])\s*', r'\1', source)
+    return source.replace(';}', '}').strip()
+
+def minify_js(source):
+    """
+    Strip comments, indentation and blank lines from a script.
+
+    This is deliberately conservative: only whole-line // comments and
+    /* */ blocks are removed and statements keep their line breaks, so the
+    result does not depend on semicolon insertion. The sources in
+    ASSET_SOURCE_DIR must not contain '/*' inside strings.
+    """
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+MINIFIERS = {'js': minify_js, 'css': minify_css}
+
+def _read_sources(kind, source_dir):
+    parts = []
+    for name in ASSET_SOURCES[kind]:
+        with open(os.path.join(source_dir, name), 'r', encoding='utf-8') as f:
+            parts.append(f.read())
+    return '\n'.join(parts)
+
+def build_asset_bundle(output_dir='.', source_dir=ASSET_SOURCE_DIR, static_dir=STATIC_DIR):
+    """
+    Write the minified JS and CSS bundles for the map page.
+
+    Each bundle is named after a hash of its content, e.g.
+    static/map.1a2b3c4d5e.js, so browsers can cache it indefinitely and a
+    changed bundle gets a new URL. Bundles from earlier builds are removed.
+    Returns {'js': url, 'css': url} with URLs relative to output_dir.
+    """
+    bundle_dir = os.path.join(output_dir, static_dir)
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    urls = {}
+    current = set()
+    for kind, minify in MINIFIERS.items():
+        source = _read_sources(kind, source_dir)
+        content = minify(source)
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:HASH_LENGTH]
+        name = f"map.{digest}.{kind}"
+        path = os.path.join(bundle_dir, name)
+        current.add(name)
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            print(f"Asset bundle {path}: {len(source.encode())} -> {len(content.encode())} bytes")
+        urls[kind] = Path(static_dir, name).as_posix()
+
+    for name in os.listdir(bundle_dir):
+        if re.fullmatch(r'map\.[0-9a-f]+\.(js|css)', name) and name not in current:
+            os.remove(os.path.join(bundle_dir, name))
+    return urls
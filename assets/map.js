@@ -0,0 +1,80 @@
+// Scripts for the generated map page, bundled by asset_bundle.py
+
+// Function to handle map click events
+function handleMapClick(e) {
+    // Format the coordinates with 6 decimal places
+    var lat = e.latlng.lat.toFixed(6);
+    var lng = e.latlng.lng.toFixed(6);
+
+    // Get the coordinates display element
+    var coordBox = document.getElementById('coordinates-box');
+    var coordDisplay = document.getElementById('coordinates');
+
+    // Update and show the coordinates box
+    if (coordDisplay && coordBox) {
+        coordDisplay.textContent = lat + ", " + lng;
+        coordBox.style.display = "block";
+
+        // Copy to clipboard if available
+        if (navigator.clipboard) {
+            navigator.clipboard.writeText(lat + ", " + lng);
+        }
+    } else {
+        console.error("Coordinates display elements not found");
+    }
+}
+
+// The map scripts run after this bundle, so attach once the page has loaded
+window.addEventListener('load', function() {
+    // folium stores each Leaflet map in a global variable
+    var found = false;
+    Object.keys(window).forEach(function(name) {
+        if (name.indexOf('map_') === 0 && window[name] instanceof L.Map) {
+            window[name].on('click', handleMapClick);
+            found = true;
+        }
+    });
+    if (!found) {
+        console.error("Could not find the Leaflet map to add the click handler to");
+    }
+});
+
+function showFullscreen(imgSrc) {
+    // Create overlay if it doesn't exist
+    if (!document.getElementById('fullscreen-overlay')) {
+        const overlay = document.createElement('div');
+        overlay.id = 'fullscreen-overlay';
+        overlay.className = 'fullscreen-overlay';
+
+        const closeBtn = document.createElement('button');
+        closeBtn.className = 'close-button';
+        closeBtn.innerHTML = '×';
+        closeBtn.onclick = hideFullscreen;
+
+        const img = document.createElement('img');
+        img.className = 'fullscreen-image';
+
+        overlay.appendChild(closeBtn);
+        overlay.appendChild(img);
+        document.body.appendChild(overlay);
+
+        overlay.onclick = function(e) {
+            if (e.target === overlay) {
+                hideFullscreen();
+            }
+        };
+    }
+
+    // Update and show overlay
+    const overlay = document.getElementById('fullscreen-overlay');
+    const fullscreenImg = overlay.querySelector('.fullscreen-image');
+    fullscreenImg.src = imgSrc;
+    overlay.style.display = 'flex';
+}
+
+function hideFullscreen() {
+    const overlay = document.getElementById('fullscreen-overlay');
+    if (overlay) {
+        overlay.style.display = 'none';
+    }
+}
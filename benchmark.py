@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BOUNDARY_FIXTURE = os.path.join(REPO_DIR, 'data', 'cologne_boundary.json')
+DEFAULT_BASELINE = os.path.join(REPO_DIR, 'benchmarks', 'baseline.json')
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+# Points share this many placeholder images, so image work stays bounded
+PLACEHOLDER_IMAGES = 16
+
+# A result is a regression when it is this much worse than the baseline
+DEFAULT_TOLERANCE = 0.25
+
+# Cumulative `python -X importtime` budget per entry point, in milliseconds;
+# heavy libraries (folium, geopandas, osmnx, Pillow) must be imported lazily
+IMPORT_BUDGETS_MS = {
+    'main': 150,
+    'point_manager': 100,
+    'bulk_import': 100,
+    'image_store': 100,
+    'spatial_index': 100,
+}
+
+def measure_import_ms(module):
+    """Cumulative import time of a module in a fresh interpreter, in milliseconds"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True,
+    )
+    for line in reversed(completed.stderr.splitlines()):
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No importtime line for {module}")
+
+def check_import_budgets(budgets=IMPORT_BUDGETS_MS):
+    """Print import times against their budgets; return the modules over budget"""
+    print(f"\n{'Entry point':<16} {'Import (ms)':>12} {'Budget (ms)':>12}")
+    over = []
+    for module, budget in budgets.items():
+        # Best of three to smooth out a cold disk cache
+        elapsed = min(measure_import_ms(module) for _ in range(3))
+        flag = "" if elapsed <= budget else "  OVER BUDGET"
+        print(f"{module:<16} {elapsed:>12.1f} {budget:>12}{flag}")
+        if elapsed > budget:
+            over.append(module)
+    return over
+
+def _random_points_in_boundary(count, seed):
+    """count (lat, lon) pairs uniformly distributed inside the Cologne boundary"""
+    import numpy as np
+    import shapely
+    from boundary_geometry import convert_esri_geojson_to_polygon
+
+    polygon = convert_esri_geojson_to_polygon(BOUNDARY_FIXTURE).geometry.iloc[0]
+    shapely.prepare(polygon)
+    west, south, east, north = polygon.bounds
+    rng = np.random.default_rng(seed)
+
+    lats, lons = [], []
+    remaining = count
+    while remaining > 0:
+        # The boundary fills roughly half of its bounding box
+        lon = rng.uniform(west, east, remaining * 2)
+        lat = rng.uniform(south, north, remaining * 2)
+        inside = shapely.contains_xy(polygon, lon, lat)
+        lons.extend(lon[inside][:remaining].round(6).tolist())
+        lats.extend(lat[inside][:remaining].round(6).tolist())
+        remaining = count - len(lats)
+    return list(zip(lats, lons))
+
+def _write_placeholder_images(images_dir, count):
+    from PIL import Image
+
+    os.makedirs(images_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join('images', f"placeholder_{i}.jpg")
+        Image.new("RGB", (1200, 900), ((i * 53) % 256, (i * 97) % 256, (i * 31) % 256)).save(
+            os.path.join(os.path.dirname(images_dir), path), "JPEG", quality=85
+        )
+        paths.append(path)
+    return paths
+
+def create_fixture(workdir, size, seed=0):
+    """
+    Lay out a self-contained build directory with size synthetic points.
+
+    Only the boundary file is copied; no OSM file is needed because the
+    default build never loads the street network.
+    """
+    import storage
+
+    os.makedirs(os.path.join(workdir, 'data'), exist_ok=True)
+    shutil.copy2(BOUNDARY_FIXTURE, os.path.join(workdir, 'data', 'cologne_boundary.json'))
+    images = _write_placeholder_images(os.path.join(workdir, 'images'), PLACEHOLDER_IMAGES)
+
+    rows = [
+        (lat, lon, f"Synthetic tag {i}", images[i % len(images)], None)
+        for i, (lat, lon) in enumerate(_random_points_in_boundary(size, seed))
+    ]
+    storage.get_connection(os.path.join(workdir, 'map_points.db'))
+    storage.insert_points(rows)
+    storage.close_connection()
+
+def run_build(workdir, build_args):
+    """Run main.py in workdir and return its profile, wall time and output size"""
+    profile_path = os.path.join(workdir, 'profile.json')
+    command = [sys.executable, os.path.join(REPO_DIR, 'main.py'), '--force',
+               '--profile-json', profile_path, *build_args]
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if completed.returncode != 0 or not os.path.exists(profile_path):
+        print(completed.stdout[-2000:])
+        print(completed.stderr[-2000:])
+        raise RuntimeError(f"Build failed in {workdir}")
+
+    with open(profile_path, "r", encoding="utf-8") as f:
+        profile = json.load(f)
+    output_path = os.path.join(workdir, 'index.html')
+    rss_values = [phase["rss_peak_mb"] for phase in profile["phases"] if phase["rss_peak_mb"] is not None]
+    return {
+        "wall_seconds": wall,
+        "html_bytes": os.path.getsize(output_path),
+        "peak_rss_mb": max(rss_values) if rss_values else None,
+        "phases": {phase["phase"]: phase["wall_seconds"] for phase in profile["phases"]},
+    }
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a list of human-readable regressions against the baseline"""
+    regressions = []
+    for size, result in results.items():
+        reference = baseline.get(size)
+        if not reference:
+            continue
+        for metric in ("wall_seconds", "html_bytes", "peak_rss_mb"):
+            old, new = reference.get(metric), result.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{size} points: {metric} {old:.1f} -> {new:.1f} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+def print_results(results):
+    print(f"\n{'Points':>8} {'Wall (s)':>9} {'HTML (KB)':>10} {'Peak RSS (MB)':>14}  Slowest phases")
+    for size, result in results.items():
+        slowest = sorted(result["phases"].items(), key=lambda item: item[1], reverse=True)[:3]
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in slowest)
+        rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+        print(f"{size:>8} {result['wall_seconds']:>9.2f} {result['html_bytes'] / 1000:>10.0f} {rss:>14}  {phases}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the map build on synthetic point datasets")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Numbers of synthetic points to benchmark")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown/growth relative to the baseline (0.25 = 25%%)")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary build directories")
+    parser.add_argument("--imports", action="store_true",
+                        help="Only check the import time budgets of the entry points")
+    parser.add_argument("build_args", nargs=argparse.REMAINDER,
+                        help="Extra arguments for main.py, after --")
+    args = parser.parse_args(argv)
+    build_args = [arg for arg in args.build_args if arg != "--"]
+
+    if args.imports:
+        return 1 if check_import_budgets() else 0
+
+    sys.path.insert(0, REPO_DIR)
+    results = {}
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix=f"where-is-sony-bench-{size}-")
+        try:
+            print(f"Benchmarking {size} points in {workdir}")
+            create_fixture(workdir, size)
+            results[str(size)] = run_build(workdir, build_args)
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
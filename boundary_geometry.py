@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+
+GEOMETRY_CACHE_DIR = os.path.join('cache', 'geometry')
+
+# Douglas-Peucker tolerance in degrees (~5 m at Cologne's latitude)
+BOUNDARY_SIMPLIFY_TOLERANCE = 0.00005
+
+# Grid size the simplified coordinates are snapped to (~0.1 m)
+COORDINATE_PRECISION = 0.000001
+
+# Bump when the preprocessing changes so stale cache entries are ignored
+GEOMETRY_CACHE_VERSION = 1
+
+def convert_esri_geojson_to_polygon(filepath):
+    """
+    Converts an ESRI-style GeoJSON with 'rings' into a standard GeoDataFrame
+    """
+    import geopandas as gpd
+    from shapely.geometry import Polygon
+
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if not data.get("features") or len(data["features"]) == 0:
+            print(f"ERROR: GeoJSON file {filepath} has no features")
+            raise ValueError("Invalid GeoJSON: No features found")
+
+        # Take the first feature's ring as the main polygon
+        rings = data["features"][0]["geometry"].get("rings")
+        if not rings or len(rings) == 0:
+            print(f"ERROR: GeoJSON feature has no rings at {filepath}")
+            raise ValueError("Invalid GeoJSON: No rings found in feature")
+
+        # ESRI GeoJSON has longitude,latitude ordering
+        try:
+            polygon = Polygon(rings[0])
+
+            # Create a GeoDataFrame with EPSG:4326
+            gdf = gpd.GeoDataFrame(geometry=[polygon], crs="EPSG:4326")
+            bounds = gdf.total_bounds
+            print(f"Successfully loaded boundary with bounds [west, south, east, north]: [{bounds[0]}, {bounds[1]}, {bounds[2]}, {bounds[3]}]")
+            return gdf
+        except Exception as e:
+            print(f"ERROR creating polygon: {e}")
+            raise
+
+    except json.JSONDecodeError:
+        print(f"ERROR: {filepath} is not valid JSON")
+        raise
+    except Exception as e:
+        print(f"ERROR loading GeoJSON file {filepath}: {e}")
+        raise
+
+def load_boundary_polygon(boundary_path):
+    """
+    The boundary polygon of an ESRI-style GeoJSON file or of a cached
+    Nominatim response (a .json.gz file from osm_cache).
+    """
+    if boundary_path.endswith('.json.gz'):
+        from osm_cache import entry_geometry, read_entry
+
+        polygon = entry_geometry(read_entry(boundary_path))
+        print(f"Successfully loaded boundary from cached response {boundary_path} with bounds {list(polygon.bounds)}")
+        return polygon
+    return convert_esri_geojson_to_polygon(boundary_path).geometry.iloc[0]
+
+def _geometry_stats(geometry):
+    """Vertex count and serialized GeoJSON size of a geometry"""
+    import shapely
+    from shapely.geometry import mapping
+
+    return {
+        "vertices": int(shapely.get_num_coordinates(geometry)),
+        "bytes": len(json.dumps(mapping(geometry))),
+    }
+
+def _cache_key(boundary_path, tolerance):
+    digest = hashlib.sha1()
+    with open(boundary_path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(f"{tolerance}:{COORDINATE_PRECISION}:{GEOMETRY_CACHE_VERSION}".encode())
+    return digest.hexdigest()
+
+def _print_geometry_report(stats):
+    print("Boundary geometry preprocessing:")
+    for name in ("boundary", "mask"):
+        before = stats[name]["before"]
+        after = stats[name]["after"]
+        print(
+            f"  {name:<8} vertices {before['vertices']:>7} -> {after['vertices']:<7}"
+            f" bytes {before['bytes']:>9} -> {after['bytes']}"
+        )
+
+def preprocess_boundary(polygon, tolerance=BOUNDARY_SIMPLIFY_TOLERANCE):
+    """
+    Simplify the boundary polygon and compute the world mask around it.
+
+    Returns (boundary, mask, stats) where boundary and mask are shapely
+    geometries and stats holds vertex counts and byte sizes before and after.
+    """
+    import shapely
+    from shapely.geometry import box
+
+    world = box(-180, -90, 180, 90)
+    full_mask = world.difference(polygon)
+
+    simplified = polygon.simplify(tolerance, preserve_topology=True)
+    simplified = shapely.set_precision(simplified, COORDINATE_PRECISION)
+    mask = world.difference(simplified)
+
+    stats = {
+        "tolerance": tolerance,
+        "boundary": {"before": _geometry_stats(polygon), "after": _geometry_stats(simplified)},
+        "mask": {"before": _geometry_stats(full_mask), "after": _geometry_stats(mask)},
+    }
+    return simplified, mask, stats
+
+def load_full_boundary(boundary_path, cache_dir=GEOMETRY_CACHE_DIR):
+    """
+    The unsimplified boundary polygon, for checking which points lie inside.
+
+    Simplifying moves the outline by up to the tolerance, so points near the
+    border are tested against this polygon rather than the display boundary.
+    Cached under cache_dir by the boundary file's content hash, like
+    load_boundary_geometry.
+    """
+    from shapely.geometry import mapping, shape
+
+    cache_path = os.path.join(cache_dir, f"{_cache_key(boundary_path, None)}.full.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return shape(json.load(f))
+
+    polygon = load_boundary_polygon(boundary_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(mapping(polygon), f)
+    return polygon
+
+def load_boundary_geometry(boundary_path, tolerance=BOUNDARY_SIMPLIFY_TOLERANCE, cache_dir=GEOMETRY_CACHE_DIR):
+    """
+    Load the simplified boundary and its "Outside Cologne" mask as GeoDataFrames.
+
+    boundary_path is an ESRI-style GeoJSON file or a cached Nominatim
+    response, see load_boundary_polygon. Results are cached under cache_dir
+    by the boundary file's content hash and the tolerance, so an unchanged
+    boundary file skips parsing and geometry work entirely.
+    """
+    import geopandas as gpd
+    from shapely.geometry import mapping, shape
+
+    key = _cache_key(boundary_path, tolerance)
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        print(f"DEBUG: Using cached boundary geometry {cache_path}")
+        boundary = shape(cached["boundary"])
+        mask = shape(cached["mask"])
+        stats = cached["stats"]
+    else:
+        polygon = load_boundary_polygon(boundary_path)
+        boundary, mask, stats = preprocess_boundary(polygon, tolerance)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "boundary": mapping(boundary),
+                "mask": mapping(mask),
+                "stats": stats,
+            }, f)
+
+    _print_geometry_report(stats)
+    return (
+        gpd.GeoDataFrame(geometry=[boundary], crs="EPSG:4326"),
+        gpd.GeoDataFrame(geometry=[mask], crs="EPSG:4326"),
+    )
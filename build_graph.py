@@ -0,0 +1,127 @@
+import hashlib
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from build_profile import NullProfiler, element_names
+
+# Outputs of stages with a cache key, by stage name and input hash. Lives as
+# long as the process, so repeated builds in one process (--watch) skip
+# unchanged stages; separate runs start empty.
+_stage_cache = {}
+
+class Stage(NamedTuple):
+    """
+    One step of the build.
+
+    func is called with the results of the stages named in deps as keyword
+    arguments, named after the stage with spaces replaced by underscores
+    ("boundary load" -> boundary_load). key describes the stage's other
+    inputs (e.g. a file's mtime and a tolerance); stages with a key are
+    cached by it together with the keys of their dependencies. Stages without
+    a key always run, and so do all stages that depend on them. Only give a
+    key to stages that return plain data: a cached result is handed to every
+    later build, and a folium element can only be added to one map. With
+    output_elements set, the result is a list of folium elements whose
+    rendered size is attributed to the stage.
+    """
+    name: str
+    func: Callable
+    deps: Tuple[str, ...] = ()
+    key: Optional[object] = None
+    output_elements: bool = False
+
+def _input_hash(stage, dep_hashes):
+    if stage.key is None or any(dep_hashes[dep] is None for dep in stage.deps):
+        return None
+    payload = json.dumps([stage.name, stage.key, [dep_hashes[dep] for dep in stage.deps]], default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def critical_path(stages, timings):
+    """
+    The chain of stages that determined the build's wall time: starting from
+    the stage that finished last, follow the dependency that finished last.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    current = max(timings, key=lambda name: timings[name][1])
+    path = [current]
+    while by_name[current].deps:
+        current = max(by_name[current].deps, key=lambda name: timings[name][1])
+        path.append(current)
+    return list(reversed(path))
+
+def run_stages(stages, max_workers=4, profiler=None):
+    """
+    Run the stages of a build DAG, each as soon as its dependencies are done.
+
+    Independent stages run at the same time in a thread pool; most of the
+    heavy lifting (file parsing, shapely, SQLite, Pillow in a process pool)
+    happens outside the GIL. Each stage is reported to profiler as a phase;
+    profilers that set serial (memory figures are process-wide) get the
+    stages one at a time. Returns {stage name: result} and prints the
+    critical path.
+    """
+    profiler = profiler or NullProfiler()
+    if profiler.serial:
+        max_workers = 1
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(missing)}")
+
+    results = {}
+    hashes = {}
+    timings = {}
+    cached = set()
+    pending = list(stages)
+    running = {}
+    start = time.perf_counter()
+
+    def run(stage, inputs):
+        began = time.perf_counter() - start
+        with profiler.phase(stage.name) as record:
+            result = stage.func(**inputs)
+            if stage.output_elements:
+                record["_elements"] = set().union(*(element_names(element) for element in result))
+        return result, began, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for stage in [stage for stage in pending if all(dep in results for dep in stage.deps)]:
+                pending.remove(stage)
+                hashes[stage.name] = _input_hash(stage, hashes)
+                cache_key = (stage.name, hashes[stage.name])
+                if hashes[stage.name] is not None and cache_key in _stage_cache:
+                    results[stage.name] = _stage_cache[cache_key]
+                    now = time.perf_counter() - start
+                    timings[stage.name] = (now, now)
+                    cached.add(stage.name)
+                    continue
+                inputs = {dep.replace(" ", "_"): results[dep] for dep in stage.deps}
+                running[pool.submit(run, stage, inputs)] = stage
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Build stages with circular dependencies: {', '.join(s.name for s in pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                result, began, ended = future.result()
+                results[stage.name] = result
+                timings[stage.name] = (began, ended)
+                if hashes[stage.name] is not None:
+                    _stage_cache[(stage.name, hashes[stage.name])] = result
+
+    wall = time.perf_counter() - start
+    path = critical_path(stages, timings)
+    steps = " -> ".join(
+        f"{name} (cached)" if name in cached else f"{name} {timings[name][1] - timings[name][0]:.2f}s"
+        for name in path
+    )
+    busy = sum(ended - began for began, ended in timings.values())
+    print(f"Build stages: {wall:.2f}s wall for {busy:.2f}s of stage work; critical path: {steps}")
+    return results
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+
+from asset_bundle import STATIC_DIR
+from image_derivatives import derivative_paths
+from point_data import POINT_DATA_FILE, TIMELINE_DIR, TIMELINE_INDEX_FILE
+from tile_export import TILE_INDEX_FILE, TILES_DIR
+
+BUILD_MANIFEST = os.path.join('cache', 'build_manifest.json')
+
+# Source files whose changes must trigger a full rebuild
+BUILD_SOURCES = (
+    'main.py',
+    'storage.py',
+    'build_graph.py',
+    'boundary_geometry.py',
+    'image_derivatives.py',
+    'point_data.py',
+    'point_layer.py',
+    'point_validation.py',
+    'html_stream.py',
+    'street_network.py',
+    'walking_tour.py',
+    'density_grid.py',
+    'osm_cache.py',
+    'tile_export.py',
+    'asset_bundle.py',
+    'assets/map.js',
+    'assets/map.css',
+)
+
+def _hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _image_signatures(image_paths, previous_images):
+    """
+    Content hashes of the point images, reusing the previous manifest's hash
+    when size and mtime are unchanged.
+    """
+    images = {}
+    for image_path in image_paths:
+        if image_path in images:
+            continue
+        if not os.path.exists(image_path):
+            images[image_path] = None
+            continue
+        stat = os.stat(image_path)
+        previous = previous_images.get(image_path)
+        if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime_ns:
+            images[image_path] = previous
+        else:
+            images[image_path] = [stat.st_size, stat.st_mtime_ns, _hash_file(image_path)]
+    return images
+
+def _image_hashes(images):
+    return {path: signature[2] if signature else None for path, signature in images.items()}
+
+def load_manifest(output_path, manifest_path=BUILD_MANIFEST):
+    """Return the manifest of the last build of output_path, or None"""
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get(output_path)
+    except json.JSONDecodeError:
+        print(f"WARNING: Ignoring unreadable build manifest {manifest_path}")
+        return None
+
+def save_manifest(output_path, state, manifest_path=BUILD_MANIFEST):
+    manifests = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifests = json.load(f)
+        except json.JSONDecodeError:
+            pass
+    manifests[output_path] = state
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifests, f)
+
+def compute_build_state(points, boundary_path, options, previous=None, point_details=True):
+    """
+    Describe everything a build of the map depends on.
+
+    points are database rows (id, lat, lon, description, image_path,
+    created_at), read in a single pass; options are the build settings that
+    change the output. Without point_details only a digest of the points is
+    recorded instead of one entry per point, which keeps the state small for
+    streamed builds but means changes cannot be itemized.
+    """
+    previous_images = (previous or {}).get("images", {})
+    point_entries = {}
+    digest = hashlib.sha1()
+    image_paths = {}
+    for point in points:
+        if point_details:
+            point_entries[str(point[0])] = list(point[1:])
+        else:
+            digest.update(json.dumps(list(point)).encode())
+        image_paths[point[4]] = None
+    return {
+        "sources": {path: _hash_file(path) for path in BUILD_SOURCES if os.path.exists(path)},
+        "options": options,
+        "boundary": _hash_file(boundary_path) if os.path.exists(boundary_path) else None,
+        "points": point_entries if point_details else digest.hexdigest(),
+        "images": _image_signatures(image_paths, previous_images),
+    }
+
+def build_outputs(output_dir, state):
+    """
+    Generated files the page built for state relies on: the static bundle,
+    the image derivatives and the index of its sidecar point data. Only
+    files that exist are listed, so images that failed to encode do not
+    force a rebuild every time.
+    """
+    static_dir = os.path.join(output_dir, STATIC_DIR)
+    outputs = sorted(
+        os.path.join(static_dir, name) for name in (os.listdir(static_dir) if os.path.isdir(static_dir) else ())
+        if name.startswith('map.')
+    )
+    for image_path, signature in sorted(state["images"].items()):
+        if signature:
+            outputs.extend(derivative_paths(image_path))
+    options = state["options"]
+    if options.get("tiles"):
+        outputs.append(os.path.join(output_dir, TILES_DIR, TILE_INDEX_FILE))
+    elif options.get("timeline"):
+        outputs.append(os.path.join(output_dir, TIMELINE_DIR, TIMELINE_INDEX_FILE))
+    elif options.get("popup_mode") == "lazy":
+        outputs.append(os.path.join(output_dir, POINT_DATA_FILE))
+    return [path for path in outputs if os.path.exists(path)]
+
+def plan_rebuild(previous, state, data_only_possible):
+    """
+    Compare the last build's manifest with the current state.
+
+    Returns 'up-to-date', 'data' when only the points data files need to be
+    regenerated (data_only_possible is set when the page loads its points
+    from sidecar files), or 'full'. A build whose outputs have been deleted
+    since is rebuilt in full.
+    """
+    if previous is None:
+        return "full"
+    if not all(os.path.exists(path) for path in previous.get("outputs", ())):
+        return "full"
+    for key in ("sources", "options", "boundary"):
+        if previous.get(key) != state[key]:
+            return "full"
+    if previous.get("points") == state["points"] and _image_hashes(previous.get("images", {})) == _image_hashes(state["images"]):
+        return "up-to-date"
+    return "data" if data_only_possible else "full"
+
+def describe_point_changes(previous, state):
+    """Human-readable summary of added, removed and changed points"""
+    old_points = (previous or {}).get("points", {})
+    new_points = state["points"]
+    added = len(new_points.keys() - old_points.keys())
+    removed = len(old_points.keys() - new_points.keys())
+    changed = sum(1 for key in new_points.keys() & old_points.keys() if new_points[key] != old_points[key])
+    return f"{added} added, {removed} removed, {changed} changed"
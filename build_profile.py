@@ -0,0 +1,176 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+def _peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _descendant_names(element):
+    """Names of all folium/branca elements below element"""
+    names = set()
+    stack = [element]
+    while stack:
+        current = stack.pop()
+        for name, child in getattr(current, '_children', {}).items():
+            names.add(name)
+            stack.append(child)
+    return names
+
+def element_names(element):
+    """Names of element and all elements below it, as used by attribute_output"""
+    return _descendant_names(element) | {element.get_name()}
+
+class BuildProfiler:
+    """
+    Collect wall time, memory and output size per build phase.
+
+    Use it as `with profiler.phase("name", element=map_obj) as record:`. When
+    element is given, everything the phase adds below it is remembered so
+    attribute_output can later count the rendered bytes it contributed to
+    the page; phases can also set record["output_bytes"] themselves. Python
+    allocations are traced with tracemalloc while the profiler is active.
+
+    tracemalloc and the RSS figures are process-wide, so the memory of a
+    phase that ran at the same time as another one (e.g. in a thread) is
+    shared with it; such phases are flagged as approximate. Set serial asks
+    build_graph.run_stages to run the stages one at a time, so they are not.
+    """
+
+    serial = True
+
+    def __init__(self, trace_memory=True):
+        self.phases = []
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._running = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name, element=None):
+        record = {
+            "phase": name,
+            "wall_seconds": None,
+            "alloc_peak_mb": None,
+            "rss_peak_mb": None,
+            "rss_growth_mb": None,
+            "output_bytes": None,
+            "approximate": False,
+        }
+        names_before = _descendant_names(element) if element is not None else None
+        with self._lock:
+            for other in self._running:
+                other["approximate"] = record["approximate"] = True
+            self._running.append(record)
+            rss_before = _peak_rss_mb()
+            if self.trace_memory:
+                # Resetting the peak while another phase runs loses that phase's peak
+                tracemalloc.reset_peak()
+                traced_before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            end = time.perf_counter()
+            record["wall_seconds"] = end - start
+            record["_interval"] = (start, end)
+            with self._lock:
+                self._running.remove(record)
+            if self.trace_memory:
+                _, traced_peak = tracemalloc.get_traced_memory()
+                record["alloc_peak_mb"] = max(traced_peak - traced_before, 0) / 1_000_000
+            rss_after = _peak_rss_mb()
+            if rss_after is not None:
+                record["rss_peak_mb"] = rss_after
+                record["rss_growth_mb"] = rss_after - rss_before
+            if names_before is not None:
+                record["_elements"] = _descendant_names(element) - names_before
+            self.phases.append(record)
+
+    def attribute_output(self, figure):
+        """
+        Set output_bytes of phases that registered an element, from the
+        rendered scripts of the elements they added. Call after the figure
+        has been rendered (e.g. after map.save).
+        """
+        sizes = {}
+        for section in (figure.header, figure.html, figure.script):
+            for name, child in section._children.items():
+                try:
+                    sizes[name] = len(child.render().encode("utf-8"))
+                except Exception:
+                    continue
+
+        for record in self.phases:
+            elements = record.get("_elements")
+            if elements is not None and record["output_bytes"] is None:
+                record["output_bytes"] = sum(sizes.get(name, 0) for name in elements)
+
+    def print_table(self):
+        print("\nBuild profile")
+        print(f"{'Phase':<22} {'Wall (s)':>9} {'Alloc peak (MB)':>16} {'RSS peak (MB)':>14} {'RSS +(MB)':>10} {'Output (KB)':>12}")
+        for record in self.phases:
+            print(
+                f"{record['phase']:<22} {record['wall_seconds']:>9.3f}"
+                f" {_format(record['alloc_peak_mb'], 16)} {_format(record['rss_peak_mb'], 14)}"
+                f" {_format(record['rss_growth_mb'], 10)}"
+                f" {_format(record['output_bytes'] / 1000 if record['output_bytes'] is not None else None, 12)}"
+                f"{' *' if record['approximate'] else ''}"
+            )
+        print(f"{'total':<22} {self.total_seconds():>9.3f}")
+        if any(record["approximate"] for record in self.phases):
+            print("* ran alongside other phases; its memory figures include theirs and are approximate")
+
+    def total_seconds(self):
+        """Wall time covered by the phases; overlapping phases are counted once"""
+        total = 0.0
+        covered_until = None
+        for start, end in sorted(record["_interval"] for record in self.phases):
+            if covered_until is None or start > covered_until:
+                total += end - start
+                covered_until = end
+            elif end > covered_until:
+                total += end - covered_until
+                covered_until = end
+        return total
+
+    def to_dict(self):
+        return {
+            "phases": [
+                {key: value for key, value in record.items() if not key.startswith("_")}
+                for record in self.phases
+            ],
+            "total_seconds": self.total_seconds(),
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print(f"Build profile written to {path}")
+
+def _format(value, width):
+    return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+@contextmanager
+def _no_phase(name, element=None):
+    yield {}
+
+class NullProfiler:
+    """Stand-in used when a build is not profiled"""
+
+    serial = False
+    phase = staticmethod(_no_phase)
+
+    def attribute_output(self, figure):
+        pass
@@ -0,0 +1,104 @@
+import functools
+import os
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from storage import DB_PATH
+
+# The database (with its WAL file) and the inputs of the map
+WATCH_PATHS = (DB_PATH, DB_PATH + '-wal', 'images', 'data')
+
+# Written by the build itself, so changes there must not trigger a rebuild
+IGNORED_DIRS = (os.path.join('images', 'derived'),)
+
+POLL_INTERVAL = 0.5
+
+# A rebuild starts once nothing has changed for this long
+DEBOUNCE_SECONDS = 1.0
+
+DEFAULT_PORT = 8000
+
+def snapshot(paths=WATCH_PATHS, ignored=IGNORED_DIRS):
+    """{file path: (mtime_ns, size)} for the given files and everything below the given directories"""
+    ignored = {os.path.normpath(path) for path in ignored}
+    files = {}
+    stack = []
+    for path in paths:
+        if os.path.isdir(path):
+            stack.append(path)
+        elif os.path.exists(path):
+            stat = os.stat(path)
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+    while stack:
+        directory = stack.pop()
+        if os.path.normpath(directory) in ignored:
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+def describe_changes(before, after):
+    added = len(after.keys() - before.keys())
+    removed = len(before.keys() - after.keys())
+    changed = sum(1 for path in after.keys() & before.keys() if after[path] != before[path])
+    return f"{added} added, {removed} removed, {changed} changed"
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def start_preview_server(directory='.', port=DEFAULT_PORT):
+    """Serve directory over HTTP from a background thread and return the server"""
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def watch_and_serve(build, output_dir='.', page='index.html', paths=WATCH_PATHS, port=DEFAULT_PORT,
+                    interval=POLL_INTERVAL, debounce=DEBOUNCE_SECONDS):
+    """
+    Build once, then call build again whenever the watched paths change.
+
+    The paths are polled every interval seconds; after a change the rebuild
+    waits until nothing has changed for debounce seconds, so a burst of
+    writes (a bulk import, several photos copied at once) causes a single
+    rebuild. build is expected to do an incremental rebuild itself. Meanwhile
+    output_dir is served on http://127.0.0.1:port/. Runs until interrupted.
+    """
+    try:
+        server = start_preview_server(output_dir, port)
+    except OSError as e:
+        print(f"ERROR: Could not start the preview server on port {port}: {e}")
+        raise
+    print(f"Serving {output_dir} at http://127.0.0.1:{port}/{page}")
+
+    try:
+        previous = snapshot(paths)
+        build()
+        print(f"Watching {', '.join(paths)} for changes (Ctrl+C to stop)")
+        while True:
+            time.sleep(interval)
+            current = snapshot(paths)
+            if current == previous:
+                continue
+            while True:
+                time.sleep(debounce)
+                settled = snapshot(paths)
+                if settled == current:
+                    break
+                current = settled
+            print(f"\nDetected changes ({describe_changes(previous, current)}), rebuilding")
+            # Changes made while building are picked up by the next poll
+            previous = current
+            build()
+    except KeyboardInterrupt:
+        print("\nStopping watch mode")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import storage
+from image_store import file_sha256, store_image
+from spatial_index import DUPLICATE_RADIUS_M, find_points_near
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+# Same limit as the interactive prompt in point_manager.py
+MAX_DESCRIPTION_LENGTH = 50
+
+# EXIF tag ids
+_EXIF_IFD = 0x8769
+_GPS_IFD = 0x8825
+_DATETIME_ORIGINAL = 36867
+_DATETIME = 306
+
+def _dms_to_degrees(dms, ref):
+    degrees = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+    # Six decimals (~0.1 m) like the coordinates copied from Google Maps
+    return round(-degrees if ref in ('S', 'W') else degrees, 6)
+
+def read_exif(image_path):
+    """
+    Return (latitude, longitude, date) from an image's EXIF data.
+
+    Any value that is not present is None; date is formatted YYYY-MM-DD.
+    """
+    from PIL import Image
+
+    latitude = longitude = date = None
+    try:
+        with Image.open(image_path) as image:
+            exif = image.getexif()
+            gps = exif.get_ifd(_GPS_IFD)
+            if gps.get(2) and gps.get(4):
+                latitude = _dms_to_degrees(gps[2], gps.get(1, 'N'))
+                longitude = _dms_to_degrees(gps[4], gps.get(3, 'E'))
+            taken = exif.get_ifd(_EXIF_IFD).get(_DATETIME_ORIGINAL) or exif.get(_DATETIME)
+            if taken:
+                date = str(taken)[:10].replace(':', '-')
+    except Exception as e:
+        print(f"WARNING: Could not read EXIF data from {image_path}: {e}")
+    return latitude, longitude, date
+
+def _candidates_from_directory(directory):
+    for path in sorted(Path(directory).iterdir()):
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+            yield {"image_path": str(path), "latitude": None, "longitude": None, "description": None}
+
+def _candidates_from_csv(csv_path):
+    """
+    Read import rows from a CSV with an image_path column and optional
+    latitude, longitude and description columns. Relative image paths are
+    resolved against the CSV's directory.
+    """
+    base_dir = Path(csv_path).parent
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            image_path = Path(row['image_path'])
+            if not image_path.is_absolute():
+                image_path = base_dir / image_path
+            yield {
+                "image_path": str(image_path),
+                "latitude": float(row['latitude']) if row.get('latitude') else None,
+                "longitude": float(row['longitude']) if row.get('longitude') else None,
+                "description": row.get('description') or None,
+            }
+
+def _prepare(candidate):
+    """Hash the image and fill in missing coordinates and description from EXIF"""
+    image_path = candidate["image_path"]
+    prepared = dict(candidate, image_hash=file_sha256(image_path))
+    if prepared["latitude"] is None or prepared["longitude"] is None or prepared["description"] is None:
+        latitude, longitude, date = read_exif(image_path)
+        if prepared["latitude"] is None or prepared["longitude"] is None:
+            prepared["latitude"], prepared["longitude"] = latitude, longitude
+        if prepared["description"] is None:
+            stem = Path(image_path).stem
+            prepared["description"] = f"{date} {stem}" if date else stem
+    prepared["description"] = prepared["description"][:MAX_DESCRIPTION_LENGTH]
+    return prepared
+
+def backfill_image_hashes():
+    """Hash images of existing points that were added before image_hash existed"""
+    missing = [
+        (point_id, image_path)
+        for point_id, (image_path, image_hash) in storage.fetch_image_hashes().items()
+        if image_hash is None and os.path.exists(image_path)
+    ]
+    if missing:
+        with ThreadPoolExecutor() as executor:
+            hashes = list(executor.map(file_sha256, [image_path for _, image_path in missing]))
+        storage.set_image_hashes(zip([point_id for point_id, _ in missing], hashes))
+        print(f"Backfilled image hashes for {len(missing)} existing points")
+
+def bulk_import(source, description=None, workers=None):
+    """
+    Import all images from a directory or CSV file as new points.
+
+    Coordinates come from the CSV or the images' EXIF GPS tags. Images
+    already in the database (same content hash) are skipped, the rest are
+    copied into the image store concurrently and inserted in one transaction.
+    Returns the number of points imported.
+    """
+    start = time.perf_counter()
+    storage.get_connection()
+    backfill_image_hashes()
+
+    if os.path.isdir(source):
+        candidates = list(_candidates_from_directory(source))
+    elif source.lower().endswith('.csv'):
+        candidates = list(_candidates_from_csv(source))
+    else:
+        raise ValueError(f"Import source must be a directory or a .csv file: {source}")
+
+    if description:
+        for candidate in candidates:
+            candidate["description"] = description
+
+    missing_files = [c for c in candidates if not os.path.exists(c["image_path"])]
+    for candidate in missing_files:
+        print(f"WARNING: Image not found, skipping: {candidate['image_path']}")
+    candidates = [c for c in candidates if os.path.exists(c["image_path"])]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        prepared = list(executor.map(_prepare, candidates))
+
+    known_hashes = {image_hash for _, image_hash in storage.fetch_image_hashes().values() if image_hash}
+    to_import = []
+    skipped_duplicates = 0
+    skipped_no_location = 0
+    for item in prepared:
+        if item["image_hash"] in known_hashes:
+            skipped_duplicates += 1
+            continue
+        if item["latitude"] is None or item["longitude"] is None:
+            print(f"WARNING: No coordinates in CSV or EXIF GPS tags, skipping: {item['image_path']}")
+            skipped_no_location += 1
+            continue
+        known_hashes.add(item["image_hash"])
+        to_import.append(item)
+        nearby = find_points_near(item["latitude"], item["longitude"], DUPLICATE_RADIUS_M)
+        if nearby:
+            ids = ", ".join(str(point.id) for point, _ in nearby)
+            print(f"WARNING: {item['image_path']} is within {DUPLICATE_RADIUS_M} m of existing point(s) {ids}")
+
+    stored = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(store_image, item["image_path"], item["image_hash"]) for item in to_import]
+            for item, future in zip(to_import, futures):
+                _, item["new_path"], is_new = future.result()
+                if is_new:
+                    stored.append(item["new_path"])
+
+        imported = storage.insert_points([
+            (item["latitude"], item["longitude"], item["description"], item["new_path"], item["image_hash"])
+            for item in to_import
+        ])
+    except Exception:
+        # Leave no orphaned copies behind if any copy or the insert failed
+        for new_path in stored:
+            if os.path.exists(new_path):
+                os.remove(new_path)
+        raise
+
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(os.path.getsize(item["new_path"]) for item in to_import)
+    rate = imported / elapsed if elapsed else 0
+    print(f"Imported {imported} points ({total_bytes / 1_000_000:.1f} MB) in {elapsed:.2f}s ({rate:.1f} points/s)")
+    print(f"Skipped {skipped_duplicates} already imported, {skipped_no_location} without coordinates, {len(missing_files)} missing files")
+    return imported
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a batch of geotagged photos as map points")
+    parser.add_argument("source", help="Directory of images or CSV with image_path[,latitude,longitude,description]")
+    parser.add_argument("--description", help="Description for all imported points (default: EXIF date and file name)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of hashing/copy threads")
+    args = parser.parse_args(argv)
+
+    try:
+        bulk_import(args.source, description=args.description, workers=args.workers)
+    except Exception as e:
+        print(f"Error importing points: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import math
+
+# Cell edge length in metres per zoom level. A level is used from its zoom up
+# to the next one; above DENSITY_MAX_ZOOM the individual markers are shown.
+DENSITY_LEVELS = {
+    10: 2000,
+    11: 1000,
+    12: 500,
+    13: 250,
+}
+DENSITY_MAX_ZOOM = max(DENSITY_LEVELS)
+
+METERS_PER_DEGREE = 111_320
+
+def cell_size(meters, latitude):
+    """(dlat, dlon) in degrees of a square cell with the given edge length at latitude"""
+    dlat = meters / METERS_PER_DEGREE
+    return dlat, dlat / math.cos(math.radians(latitude))
+
+def _count_cells(lats, lons, origin, size):
+    """(row, col, count) arrays of the non-empty grid cells"""
+    import numpy as np
+
+    rows = np.floor((lats - origin[0]) / size[0]).astype(np.int64)
+    cols = np.floor((lons - origin[1]) / size[1]).astype(np.int64)
+    # Offset so negative cells (points south or west of the boundary) keep distinct keys
+    offset = 1 << 20
+    cells, counts = np.unique((rows + offset) * (offset << 1) + cols + offset, return_counts=True)
+    return cells // (offset << 1) - offset, cells % (offset << 1) - offset, counts
+
+def build_density_levels(batches, boundary, levels=DENSITY_LEVELS):
+    """
+    Count the points per grid cell at each zoom level.
+
+    batches yields lists of database rows, so streamed builds can pass a
+    cursor. Points are binned with NumPy, one vectorized pass per level and
+    batch; cells that do not touch the boundary polygon are dropped. Each
+    level is returned as {"zoom", "origin": [south, west], "size": [dlat,
+    dlon], "cells": [row, col, count, row, col, count, ...]}, a flat integer
+    array that keeps the page small.
+    """
+    import numpy as np
+    import shapely
+
+    west, south, east, north = boundary.bounds
+    origin = (south, west)
+    sizes = {zoom: cell_size(meters, (south + north) / 2) for zoom, meters in levels.items()}
+    counts = {zoom: {} for zoom in levels}
+    total = 0
+
+    for batch in batches:
+        if not batch:
+            continue
+        total += len(batch)
+        lats = np.fromiter((point[1] for point in batch), dtype=float, count=len(batch))
+        lons = np.fromiter((point[2] for point in batch), dtype=float, count=len(batch))
+        for zoom, size in sizes.items():
+            level_counts = counts[zoom]
+            for row, col, count in zip(*(array.tolist() for array in _count_cells(lats, lons, origin, size))):
+                level_counts[row, col] = level_counts.get((row, col), 0) + count
+
+    shapely.prepare(boundary)
+    result = []
+    for zoom in sorted(levels):
+        size = sizes[zoom]
+        cells = np.array([[row, col, count] for (row, col), count in counts[zoom].items()], dtype=np.int64).reshape(-1, 3)
+        south_edges = origin[0] + cells[:, 0] * size[0]
+        west_edges = origin[1] + cells[:, 1] * size[1]
+        inside = shapely.intersects(boundary, shapely.box(west_edges, south_edges, west_edges + size[1], south_edges + size[0]))
+        cells = cells[inside]
+        result.append({
+            "zoom": zoom,
+            "origin": [round(origin[0], 6), round(origin[1], 6)],
+            "size": [round(size[0], 8), round(size[1], 8)],
+            "cells": cells.ravel().tolist(),
+        })
+    summary = ", ".join(f"z{level['zoom']} {len(level['cells']) // 3}" for level in result)
+    print(f"Density grid for {total} points: {summary} cells")
+    return result
@@ -0,0 +1,85 @@
+import json
+import os
+
+from point_data import build_point_rows
+from point_validation import points_inside, print_outside_report
+
+def _script_json(value):
+    """JSON that is safe inside a <script> block, like Jinja's tojson filter"""
+    return (
+        json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+        .replace("<", "\\u003c")
+        .replace(">", "\\u003e")
+        .replace("&", "\\u0026")
+        .replace("'", "\\u0027")
+    )
+
+def _descendants(element):
+    stack = [element]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(getattr(current, '_children', {}).values())
+
+def stream_point_rows(batches, boundary, derivatives, outside_points="flag", output_dir="."):
+    """
+    Turn batches of database rows into batches of PointLayer rows.
+
+    Each batch is checked against the boundary polygon as it passes; points
+    outside it are flagged or dropped as in point_validation.validate_points
+    and reported together once the last batch has been read.
+    """
+    import numpy as np
+
+    outliers = []
+    total = 0
+    for batch in batches:
+        inside = points_inside(batch, boundary)
+        outside = [point for point, keep in zip(batch, inside) if not keep]
+        outliers.extend(outside)
+        total += len(batch)
+        if outside_points == "exclude":
+            batch = [point for point, keep in zip(batch, inside) if keep]
+            outside_ids = frozenset()
+        else:
+            outside_ids = frozenset(point[0] for point in outside)
+        yield [row[1:] for row in build_point_rows(batch, derivatives, outside_ids, output_dir)]
+    print_outside_report(outliers, np.zeros(len(outliers), dtype=bool), boundary, total=total)
+
+def save_streaming(map_obj, output_path):
+    """
+    Write the map page to output_path, streaming in the point rows.
+
+    The page is rendered with placeholders for the rows of every
+    StreamedPointLayer; the text around them is written as is and the rows
+    are written batch by batch from each layer's row_source, so the point
+    data is never held in memory as a whole. The page is written to a
+    temporary file and moved into place once complete. Returns the number
+    of rows written.
+    """
+    from point_layer import StreamedPointLayer
+
+    html = map_obj.get_root().render()
+    layers = [element for element in _descendants(map_obj.get_root()) if isinstance(element, StreamedPointLayer)]
+    layers.sort(key=lambda layer: html.find(_script_json(layer.rows)))
+
+    tmp_path = output_path + ".tmp"
+    written = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        rest = html
+        for layer in layers:
+            before, rest = rest.split(_script_json(layer.rows), 1)
+            f.write(before)
+            f.write("[")
+            separator = ""
+            for batch in layer.row_source:
+                if not batch:
+                    continue
+                # Strip the batch's brackets so consecutive batches form one array
+                f.write(separator + _script_json(batch)[1:-1])
+                separator = ","
+                written += len(batch)
+            f.write("]")
+        f.write(rest)
+    os.replace(tmp_path, output_path)
+    return written
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+DERIVATIVES_DIR = os.path.join('images', 'derived')
+DERIVATIVES_MANIFEST = os.path.join('cache', 'image_derivatives.json')
+
+# Popups show images at 200px, so the thumbnail is 2x for high-DPI screens
+THUMBNAIL_SIZE = (400, 400)
+THUMBNAIL_QUALITY = 80
+
+# Fullscreen view is capped to a typical desktop resolution
+WEB_SIZE = (1600, 1600)
+WEB_QUALITY = 82
+
+def pool_context():
+    """multiprocessing context for process pools that may be started while other threads run"""
+    import multiprocessing
+
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def derivative_paths(image_path, output_dir=DERIVATIVES_DIR):
+    """
+    Return the (thumbnail, web) paths for a source image.
+
+    The names carry a hash of the source path, so x.jpg and x.png, or the
+    same name in two directories, get derivatives of their own.
+    """
+    path_hash = hashlib.sha1(Path(image_path).as_posix().encode()).hexdigest()[:10]
+    name = f"{Path(image_path).stem}.{path_hash}.jpg"
+    return (
+        os.path.join(output_dir, 'thumb', name),
+        os.path.join(output_dir, 'web', name),
+    )
+
+def _encode_derivatives(image_path, thumb_path, web_path):
+    """Encode the thumbnail and web-sized JPEG for one image (runs in a worker process)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(image_path) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    web = image.copy()
+    web.thumbnail(WEB_SIZE)
+    os.makedirs(os.path.dirname(web_path), exist_ok=True)
+    web.save(web_path, "JPEG", quality=WEB_QUALITY, optimize=True, progressive=True)
+
+    image.thumbnail(THUMBNAIL_SIZE)
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    image.save(thumb_path, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+
+    return image_path
+
+def _load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print(f"WARNING: Ignoring unreadable derivative manifest {manifest_path}")
+        return {}
+
+def build_image_derivatives(image_paths, output_dir=DERIVATIVES_DIR,
+                            manifest_path=DERIVATIVES_MANIFEST, workers=None):
+    """
+    Build thumbnail and web-sized derivatives for the given images.
+
+    Only images whose size/mtime changed since the last run are hashed, and
+    only images whose content hash changed are re-encoded, across a process
+    pool. Returns a dict mapping each existing source path to its
+    (thumbnail, web) paths.
+    """
+    start = time.perf_counter()
+    manifest = _load_manifest(manifest_path)
+    derivatives = {}
+    pending = []
+
+    for image_path in dict.fromkeys(image_paths):
+        if not os.path.exists(image_path):
+            continue
+
+        thumb_path, web_path = derivative_paths(image_path, output_dir)
+        derivatives[image_path] = (thumb_path, web_path)
+        stat = os.stat(image_path)
+        entry = manifest.get(image_path)
+        outputs_exist = os.path.exists(thumb_path) and os.path.exists(web_path)
+
+        if entry and outputs_exist and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            continue
+
+        content_hash = _file_hash(image_path)
+        manifest[image_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": content_hash}
+        if entry and outputs_exist and entry.get("sha1") == content_hash:
+            continue
+
+        pending.append((image_path, thumb_path, web_path))
+
+    failures = 0
+    if pending:
+        # Builds call this from worker threads, and forking a threaded process can deadlock the child
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as executor:
+            futures = [executor.submit(_encode_derivatives, *job) for job in pending]
+            for (image_path, _, _), future in zip(pending, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"WARNING: Could not build derivatives for {image_path}: {e}")
+                    manifest.pop(image_path, None)
+                    derivatives.pop(image_path, None)
+                    failures += 1
+
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    elapsed = time.perf_counter() - start
+    encoded = len(pending) - failures
+    failed_text = f", {failures} failed" if failures else ""
+    print(f"Image derivatives: {encoded} encoded, {len(derivatives) - encoded} up to date{failed_text} ({elapsed:.2f}s)")
+    return derivatives
@@ -0,0 +1,129 @@
+import argparse
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+import storage
+
+IMAGES_DIR = 'images'
+
+# Spellings of the same format share one store extension
+_EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def image_path_for(image_hash, extension, images_dir=IMAGES_DIR):
+    """Store location of an image: images/<first two hash chars>/<hash><ext>"""
+    extension = extension.lower()
+    extension = _EXTENSION_ALIASES.get(extension, extension)
+    return os.path.join(images_dir, image_hash[:2], f"{image_hash}{extension}")
+
+def store_image(source_path, image_hash=None, images_dir=IMAGES_DIR):
+    """
+    Copy an image into the content-addressed store.
+
+    Returns (image_hash, stored_path, is_new). When an image with the same
+    bytes is already stored nothing is copied and is_new is False.
+    """
+    image_hash = image_hash or file_sha256(source_path)
+    stored_path = image_path_for(image_hash, Path(source_path).suffix, images_dir)
+
+    if os.path.exists(stored_path):
+        return image_hash, stored_path, False
+
+    os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+    # Copy to a temporary name first so a half-written file is never stored
+    temp_path = f"{stored_path}.tmp"
+    shutil.copy2(source_path, temp_path)
+    os.replace(temp_path, stored_path)
+    return image_hash, stored_path, True
+
+def release_image(image_path, image_hash):
+    """
+    Delete a stored image once no point references it any more.
+
+    Returns True if the file was deleted.
+    """
+    if image_hash and storage.points_with_image_hash(image_hash):
+        return False
+    if storage.points_with_image_path(image_path):
+        return False
+    if os.path.exists(image_path):
+        os.remove(image_path)
+        return True
+    return False
+
+def migrate_images(dry_run=False):
+    """
+    Move the images of all points into the content-addressed store.
+
+    Each point's image is hashed, stored under its hash (identical files are
+    stored once) and the point's image_path/image_hash are updated. Old
+    files are removed once every point referencing them has moved. Returns
+    the number of bytes saved by deduplication.
+    """
+    points = storage.fetch_points()
+    updates = []
+    old_paths = {}
+    stored = {}
+    missing = 0
+
+    for point in points:
+        if not os.path.exists(point.image_path):
+            print(f"WARNING: Image not found at {point.image_path} for point {point.id}")
+            missing += 1
+            continue
+
+        image_hash = file_sha256(point.image_path)
+        target = image_path_for(image_hash, Path(point.image_path).suffix)
+        if point.image_path == target:
+            continue
+
+        size = os.path.getsize(point.image_path)
+        old_paths[point.image_path] = size
+        stored.setdefault(image_hash, (target, size))
+        updates.append((point.id, point.image_path, target, image_hash))
+
+    unique_bytes = sum(size for _, size in stored.values())
+    old_bytes = sum(old_paths.values())
+    saved = old_bytes - unique_bytes
+
+    print(f"{len(updates)} points reference {len(old_paths)} files ({old_bytes / 1_000_000:.1f} MB)")
+    print(f"{len(stored)} unique images ({unique_bytes / 1_000_000:.1f} MB), deduplication saves {saved / 1_000_000:.1f} MB")
+    if missing:
+        print(f"{missing} points have no image file and were left unchanged")
+
+    if dry_run or not updates:
+        return saved
+
+    for point_id, old_path, target, image_hash in updates:
+        if not os.path.exists(target):
+            store_image(old_path, image_hash)
+
+    storage.set_image_locations([(target, image_hash, point_id) for point_id, _, target, image_hash in updates])
+
+    still_referenced = {point.image_path for point in storage.fetch_points()}
+    for old_path in old_paths:
+        if old_path not in still_referenced and os.path.exists(old_path):
+            os.remove(old_path)
+
+    print(f"Migrated {len(updates)} points into the content-addressed image store")
+    return saved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the content-addressed image store")
+    parser.add_argument("command", choices=["migrate", "report"],
+                        help="'migrate' moves existing images into the store, 'report' only prints the savings")
+    args = parser.parse_args(argv)
+
+    migrate_images(dry_run=args.command == "report")
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,127 @@
-import osmnx as ox
-import folium
-from folium import plugins
-import geopandas as gpd
-import sqlite3
-import base64
-from pathlib import Path
+import argparse
+import itertools
+import storage
 import os
-from shapely.geometry import box, Polygon
-import json
+from street_network import load_street_network, osm_file_key
+from image_derivatives import build_image_derivatives
+from build_profile import BuildProfiler, NullProfiler
+from build_graph import Stage, run_stages
+from asset_bundle import build_asset_bundle
+from build_manifest import (
+    build_outputs,
+    compute_build_state,
+    describe_point_changes,
+    load_manifest,
+    plan_rebuild,
+    save_manifest,
+)
+from point_data import (
+    MARKER_MODES,
+    POPUP_MODES,
+    build_point_rows,
+    choose_marker_mode,
+    page_url,
+    write_point_data,
+    write_timeline_data,
+)
+from tile_export import TILES_DIR, export_tiles
+from osm_cache import BOUNDARY_QUERY, geocode
+from density_grid import DENSITY_MAX_ZOOM, build_density_levels
+from point_validation import OUTSIDE_POINT_MODES, validate_points
+from html_stream import save_streaming, stream_point_rows
+from boundary_geometry import (
+    BOUNDARY_SIMPLIFY_TOLERANCE,
+    load_boundary_geometry,
+    load_full_boundary,
+)
 
-def convert_esri_geojson_to_polygon(filepath):
-    """
-    Converts an ESRI-style GeoJSON with 'rings' into a standard GeoDataFrame
-    """
-    try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        if not data.get("features") or len(data["features"]) == 0:
-            print(f"ERROR: GeoJSON file {filepath} has no features")
-            raise ValueError("Invalid GeoJSON: No features found")
-            
-        # Take the first feature's ring as the main polygon
-        rings = data["features"][0]["geometry"].get("rings")
-        if not rings or len(rings) == 0:
-            print(f"ERROR: GeoJSON feature has no rings at {filepath}")
-            raise ValueError("Invalid GeoJSON: No rings found in feature")
-            
-        # ESRI GeoJSON has longitude,latitude ordering
-        try:
-            polygon = Polygon(rings[0])
-            
-            # Create a GeoDataFrame with EPSG:4326
-            gdf = gpd.GeoDataFrame(geometry=[polygon], crs="EPSG:4326")
-            bounds = gdf.total_bounds
-            print(f"Successfully loaded boundary with bounds [west, south, east, north]: [{bounds[0]}, {bounds[1]}, {bounds[2]}, {bounds[3]}]")
-            return gdf
-        except Exception as e:
-            print(f"ERROR creating polygon: {e}")
-            raise
-            
-    except json.JSONDecodeError:
-        print(f"ERROR: {filepath} is not valid JSON")
-        raise
-    except Exception as e:
-        print(f"ERROR loading GeoJSON file {filepath}: {e}")
-        raise
-
-def get_all_points():
-    """Retrieve all points from the database"""
+def get_all_points(filters=None):
+    """Retrieve all points from the database, or those matching filters (see storage.query_points)"""
     try:
-        conn = sqlite3.connect('map_points.db')
-        c = conn.cursor()
-        
-        c.execute('SELECT * FROM points')
-        points = c.fetchall()
-        
-        conn.close()
+        if filters:
+            points = storage.query_points(**filters)
+            described = ", ".join(f"{name}={value}" for name, value in filters.items())
+            print(f"Retrieved {len(points)} points matching {described} from database")
+            return points
+        points = storage.fetch_points()
         print(f"Retrieved {len(points)} points from database")
         return points
     except Exception as e:
         print(f"Error retrieving points from database: {e}")
         return []
 
-def create_interactive_map(osm_file_path, boundary_geojson_path):
+def create_interactive_map(osm_file_path, boundary_geojson_path,
+                           simplify_tolerance=BOUNDARY_SIMPLIFY_TOLERANCE, marker_mode="auto",
+                           popup_mode="inline", tiles=False, outside_points="flag", stream=False,
+                           timeline=False, filters=None, tour=False, density=False, output_dir=".", points=None,
+                           profiler=None):
     """
     Create an interactive folium map showing only Cologne, masking the rest of the world.
+
+    The OSM street network is only loaded for the walking tour (tour), since
+    no other map layer uses it. The boundary is simplified with
+    simplify_tolerance (degrees) before it is embedded in the page.
+
+    marker_mode is 'markers' (one CircleMarker per point), 'fast' (all points
+    in a single PointLayer data array) or 'auto', which switches to 'fast'
+    above FAST_MARKER_THRESHOLD points.
+
+    With popup_mode 'lazy' no point data is embedded in the page: it is written
+    to points.json and points/<shard>.json in output_dir and fetched by the
+    browser, markers on load and popup content on first click.
+
+    With tiles set, points and the boundary outline are exported as static
+    GeoJSON tiles to output_dir/tiles and the page only fetches the tiles in
+    the viewport; marker_mode and popup_mode are ignored.
+
+    Points outside the boundary are reported and, depending on outside_points,
+    drawn in a warning colour ('flag') or left off the map ('exclude').
+
+    With stream set, points are not loaded here: the page gets a
+    StreamedPointLayer that reads them batch by batch from a database cursor
+    when the map is written with html_stream.save_streaming. points,
+    marker_mode and popup_mode are ignored.
+
+    With timeline set, the points are written per month of their created_at
+    to output_dir/timeline and the page gets a slider to pick the range of
+    months shown; only the selected months are fetched. marker_mode and
+    popup_mode are ignored.
+
+    With tour set, a walk past all points along the street network is
+    planned with walking_tour and drawn as a separate layer.
+
+    With density set, the points are counted per grid cell at several zoom
+    levels (see density_grid) and, while zoomed out, the page shades those
+    cells instead of drawing the markers.
+
+    filters restrict the points to a date range, bounding box or description
+    text, see storage.query_points. points can be passed in to avoid
+    querying the database again. Each build phase is reported to profiler
+    (a build_profile.BuildProfiler), if given.
     """
+    if popup_mode not in POPUP_MODES:
+        raise ValueError(f"Unknown popup mode: {popup_mode} (expected one of {', '.join(POPUP_MODES)})")
+    profiler = profiler or NullProfiler()
+
+    # Deferred so runs that stop early (up to date, missing data) start fast
+    import folium
+    from point_layer import (
+        DensityLayer,
+        LazyPointLayer,
+        PointLayer,
+        StreamedPointLayer,
+        TiledPointLayer,
+        TimelinePointLayer,
+    )
+    # Imported before run_stages starts its threads; two stages importing
+    # one of these for the first time at once can see it half-initialized
+    import geopandas
+    import numpy
+    import shapely
+
     print("DEBUG: Starting map creation...")
     
-    if not os.path.exists(osm_file_path):
+    if tour and not os.path.exists(osm_file_path):
         print(f"ERROR: OSM file not found at {osm_file_path}")
         raise FileNotFoundError(f"OSM file not found: {osm_file_path}")
         
@@ -77,359 +129,498 @@ def create_interactive_map(osm_file_path, boundary_geojson_path):
         print(f"ERROR: Boundary GeoJSON not found at {boundary_geojson_path}")
         raise FileNotFoundError(f"Boundary file not found: {boundary_geojson_path}")
     
-    print(f"DEBUG: Loading boundary from {boundary_geojson_path}")
-    # Load and convert the ESRI-style GeoJSON
-    boundary = convert_esri_geojson_to_polygon(boundary_geojson_path)
-
-    bounds = boundary.total_bounds
-    # In GeoDataFrame total_bounds, the order is [xmin, ymin, xmax, ymax] 
-    # which is [west, south, east, north]
-    west, south, east, north = bounds
-    print(f"DEBUG: Boundary bounds - West:{west}, South:{south}, East:{east}, North:{north}")
-
-    # Create a base map centered on Cologne
-    cologne_center = [south + (north - south)/2, west + (east - west)/2]
-    print(f"DEBUG: Creating map centered at {cologne_center}")
-    
-    # Create map with explicit tile layer
-    m = folium.Map(
-        location=cologne_center, 
-        zoom_start=12,
-        tiles='OpenStreetMap',
-        prefer_canvas=True
-    )
-    
-    # Add coordinates display box to the map
-    coordinates_div_html = """
-    <div id="coordinates-box" style="
-        position: fixed;
-        bottom: 20px;
-        left: 20px;
-        background-color: white;
-        padding: 10px;
-        border-radius: 4px;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.3);
-        z-index: 1000;
-        font-family: Arial, sans-serif;
-        font-size: 12px;
-        display: none;
-    ">
-        <strong>Clicked Coordinates:</strong> <span id="coordinates"></span>
-    </div>
-    """
-    
-    m.get_root().html.add_child(folium.Element(coordinates_div_html))
-    
-    # JavaScript for handling clicks
-    click_script = """
-    <script>
-        // Function to handle map click events
-        function handleMapClick(e) {
-            // Format the coordinates with 6 decimal places
-            var lat = e.latlng.lat.toFixed(6);
-            var lng = e.latlng.lng.toFixed(6);
-            
-            // Get the coordinates display element
-            var coordBox = document.getElementById('coordinates-box');
-            var coordDisplay = document.getElementById('coordinates');
-            
-            // Update and show the coordinates box
-            if (coordDisplay && coordBox) {
-                coordDisplay.textContent = lat + ", " + lng;
-                coordBox.style.display = "block";
-                
-                // Copy to clipboard if available
-                if (navigator.clipboard) {
-                    navigator.clipboard.writeText(lat + ", " + lng);
-                }
-            } else {
-                console.error("Coordinates display elements not found");
-            }
-        }
-        
-        // Wait for the map to be fully loaded
-        window.addEventListener('load', function() {
-            console.log("Window loaded, setting up click handler");
-            setTimeout(function() {
-                // Get the map object
-                var mapContainer = document.getElementsByClassName('folium-map')[0];
-                if (mapContainer && mapContainer._leaflet_id) {
-                    // Access the Leaflet map instance
-                    var leafletMap = window.L.Map.getMapById(mapContainer._leaflet_id);
-                    if (leafletMap) {
-                        console.log("Adding click handler to map");
-                        leafletMap.on('click', handleMapClick);
-                    } else {
-                        console.error("Could not get Leaflet map instance");
-                    }
-                } else {
-                    console.error("Map container not found or not initialized");
-                }
-            }, 1000); // Give the map a second to fully initialize
-        });
-    </script>
-    """
-    
-    m.get_root().header.add_child(folium.Element(click_script))
-    
-    try:
-        print(f"DEBUG: Loading OSM data from {osm_file_path}")
-        graph = ox.graph_from_xml(osm_file_path)
-        nodes, edges = ox.graph_to_gdfs(graph)
-        print(f"DEBUG: Loaded {len(edges)} edges from OSM")
-        
-    except Exception as e:
-        print(f"ERROR loading OSM data: {e}")
-        print("Continuing without OSM data...")
-    
-    # Set map bounds to the Cologne boundary - CORRECTED ORDER
-    # Folium's fit_bounds expects [[south, west], [north, east]]
-    print("DEBUG: Setting map bounds to [[south, west], [north, east]]")
-    m.fit_bounds([[south, west], [north, east]])
-    
-    # Add the Cologne boundary itself
-    folium.GeoJson(
-        boundary,
-        name="Cologne Boundary",
-        style_function=lambda x: {
-            'fillColor': 'transparent',
-            'color': 'grey',
-            'weight': 2,
-        }
-    ).add_to(m)
-    
-    # Create a world bounding box for the mask
-    print("DEBUG: Creating mask overlay")
-    world = gpd.GeoDataFrame(geometry=[box(-180, -90, 180, 90)], crs="EPSG:4326")
-    
-    try:
-        # Create a mask: World minus Cologne
-        mask = gpd.overlay(world, boundary, how="difference")
+    def file_key(path):
+        stat = os.stat(path)
+        return [path, stat.st_mtime_ns, stat.st_size]
+
+    def boundary_stage():
+        print(f"DEBUG: Loading boundary from {boundary_geojson_path}")
+        # Load the simplified boundary and mask, cached by the file's content hash
+        return load_boundary_geometry(boundary_geojson_path, tolerance=simplify_tolerance)
+
+    def full_boundary_stage():
+        # Points are checked against the exact boundary, not the simplified one
+        return load_full_boundary(boundary_geojson_path)
+
+    def osm_stage():
+        if not tour:
+            return None
+        try:
+            print(f"DEBUG: Loading OSM data from {osm_file_path}")
+            nodes, edges = load_street_network(osm_file_path)
+            print(f"DEBUG: Loaded {len(edges)} edges from OSM")
+            # The key of the street network cache also keys the tour's distance matrix
+            return nodes, edges, osm_file_key(osm_file_path)
+        except Exception as e:
+            print(f"ERROR loading OSM data: {e}")
+            print("Continuing without OSM data...")
+            return None
+
+    def base_map_stage(boundary_load):
+        boundary, mask = boundary_load
+        bounds = boundary.total_bounds
+        # In GeoDataFrame total_bounds, the order is [xmin, ymin, xmax, ymax] 
+        # which is [west, south, east, north]
+        west, south, east, north = bounds
+        print(f"DEBUG: Boundary bounds - West:{west}, South:{south}, East:{east}, North:{north}")
+
+        # Create a base map centered on Cologne
+        cologne_center = [south + (north - south)/2, west + (east - west)/2]
+        print(f"DEBUG: Creating map centered at {cologne_center}")
         
-        # Add the gray mask outside Cologne
-        folium.GeoJson(
-            mask,
-            name="Outside Cologne",
-            style_function=lambda x: {
-                'fillColor': 'gray',
-                'color': 'gray',
-                'fillOpacity': 0.3,
-                'weight': 0,
-            }
-        ).add_to(m)
-    except Exception as e:
-        print(f"ERROR creating mask overlay: {e}")
-        print("Continuing without mask...")
-    
-    # Add custom CSS and JavaScript for fullscreen functionality
-    custom_css = """
-        <style>
-            .fullscreen-overlay {
-                display: none;
-                position: fixed;
-                top: 0;
-                left: 0;
-                width: 100%;
-                height: 100%;
-                background-color: rgba(0, 0, 0, 0.9);
-                z-index: 9999;
-                justify-content: center;
-                align-items: center;
-                cursor: pointer;
-            }
-            .fullscreen-image {
-                max-width: 90%;
-                max-height: 90%;
-                object-fit: contain;
-            }
-            .popup-image {
-                cursor: pointer;
-                transition: transform 0.2s;
-            }
-            .popup-image:hover {
-                transform: scale(1.05);
-            }
-            .close-button {
-                position: fixed;
-                top: 20px;
-                right: 20px;
-                color: white;
-                font-size: 30px;
-                cursor: pointer;
-                background: none;
-                border: none;
-                padding: 10px;
-            }
-        </style>
-    """
-    
-    custom_js = """
-        <script>
-        function showFullscreen(imgSrc) {
-            // Create overlay if it doesn't exist
-            if (!document.getElementById('fullscreen-overlay')) {
-                const overlay = document.createElement('div');
-                overlay.id = 'fullscreen-overlay';
-                overlay.className = 'fullscreen-overlay';
-                
-                const closeBtn = document.createElement('button');
-                closeBtn.className = 'close-button';
-                closeBtn.innerHTML = '×';
-                closeBtn.onclick = hideFullscreen;
-                
-                const img = document.createElement('img');
-                img.className = 'fullscreen-image';
-                
-                overlay.appendChild(closeBtn);
-                overlay.appendChild(img);
-                document.body.appendChild(overlay);
-                
-                overlay.onclick = function(e) {
-                    if (e.target === overlay) {
-                        hideFullscreen();
-                    }
-                };
-            }
-            
-            // Update and show overlay
-            const overlay = document.getElementById('fullscreen-overlay');
-            const fullscreenImg = overlay.querySelector('.fullscreen-image');
-            fullscreenImg.src = imgSrc;
-            overlay.style.display = 'flex';
-        }
+        # Create map with explicit tile layer
+        m = folium.Map(
+            location=cologne_center, 
+            zoom_start=12,
+            tiles='OpenStreetMap',
+            prefer_canvas=True
+        )
         
-        function hideFullscreen() {
-            const overlay = document.getElementById('fullscreen-overlay');
-            if (overlay) {
-                overlay.style.display = 'none';
-            }
-        }
-        </script>
-    """
-    
-    m.get_root().header.add_child(folium.Element(custom_css))
-    m.get_root().header.add_child(folium.Element(custom_js))
-    
-    print("DEBUG: Adding points from database")
-    points = get_all_points()
-    for point in points:
-        id, lat, lon, description, image_path, created_at = point
+        # Add coordinates display box to the map; it is styled and filled in by the asset bundle
+        coordinates_div_html = """
+        <div id="coordinates-box">
+            <strong>Clicked Coordinates:</strong> <span id="coordinates"></span>
+        </div>
+        """
         
-        if not os.path.exists(image_path):
-            print(f"WARNING: Image not found at {image_path} for point {id}")
-            img_html = f"<p>Image not found: {image_path}</p>"
-        else:
-            # Create HTML for popup with clickable image
-            img_html = f'''
-                <img src="{image_path}" 
-                     class="popup-image" 
-                     style="width:200px;" 
-                     onclick="showFullscreen('{image_path}')"
-                     title="Click to view fullscreen">
-            '''
+        m.get_root().html.add_child(folium.Element(coordinates_div_html))
         
-        popup_html = f'''
-            <div style="width:220px;">
-                {img_html}<br>
-                <p>{description}</p>
-            </div>
-        '''
+        # The click handler and fullscreen viewer live in a cacheable, content-hashed bundle
+        bundle = build_asset_bundle(output_dir)
+        m.get_root().header.add_child(folium.CssLink(bundle["css"]))
+        m.get_root().header.add_child(folium.JavascriptLink(bundle["js"]))
         
-        folium.CircleMarker(
-            location=[lat, lon],
-            popup=folium.Popup(popup_html, max_width=250),
-            radius=5,  # Size of the circle in pixels
-            color='red',  # Circle outline color
-            fill=True,
-            fill_color='red',  # Circle fill color
-            fill_opacity=0.7,
-            weight=1  # Border weight
-        ).add_to(m)
+        # Set map bounds to the Cologne boundary - CORRECTED ORDER
+        # Folium's fit_bounds expects [[south, west], [north, east]]
+        print("DEBUG: Setting map bounds to [[south, west], [north, east]]")
+        m.fit_bounds([[south, west], [north, east]])
+        return m
+
+    def mask_stage(boundary_load):
+        boundary, mask = boundary_load
+        layers = []
+        # Add the Cologne boundary itself; tiled maps load its outline with the points
+        if not tiles:
+            layers.append(folium.GeoJson(
+                boundary,
+                name="Cologne Boundary",
+                style_function=lambda x: {
+                    'fillColor': 'transparent',
+                    'color': 'grey',
+                    'weight': 2,
+                }
+            ))
     
-    folium.LayerControl().add_to(m)
+        print("DEBUG: Creating mask overlay")
+        try:
+            # Add the gray mask outside Cologne
+            layers.append(folium.GeoJson(
+                mask,
+                name="Outside Cologne",
+                style_function=lambda x: {
+                    'fillColor': 'gray',
+                    'color': 'gray',
+                    'fillOpacity': 0.3,
+                    'weight': 0,
+                }
+            ))
+        except Exception as e:
+            print(f"ERROR creating mask overlay: {e}")
+            print("Continuing without mask...")
+        return layers
+
+    def points_stage():
+        print("DEBUG: Adding points from database")
+        return get_all_points(filters)
+
+    # Points the caller already queried are used as they are
+    def validation_stage(full_boundary_load, points_query=points):
+        if stream:
+            return None, frozenset()
+        return validate_points(points_query, full_boundary_load, outside_points)
+
+    def derivatives_stage(point_validation):
+        valid_points, _ = point_validation
+        if stream:
+            return build_image_derivatives(storage.fetch_image_paths())
+        return build_image_derivatives([point[4] for point in valid_points])
+
+    def marker_stage(boundary_load, full_boundary_load, point_validation, image_derivatives):
+        boundary, _ = boundary_load
+        valid_points, outside_ids = point_validation
+        derivatives = image_derivatives
+        if stream:
+            mode = "stream"
+            point_count = storage.count_points()
+        else:
+            if tiles:
+                mode = "tiles"
+            elif timeline:
+                mode = "timeline"
+            elif popup_mode == "lazy":
+                mode = "lazy"
+            else:
+                mode = choose_marker_mode(marker_mode, len(valid_points))
+            point_count = len(valid_points)
+        print(f"DEBUG: Rendering {point_count} points in '{mode}' marker mode")
+
+        if stream:
+            row_source = stream_point_rows(storage.iter_points(), full_boundary_load, derivatives, outside_points,
+                                           output_dir)
+            return [StreamedPointLayer(row_source, name="Points")]
+        if tiles:
+            # Only the tiles covering the viewport are fetched by the page
+            export_tiles(build_point_rows(valid_points, derivatives, outside_ids, output_dir),
+                         boundary.geometry.iloc[0], os.path.join(output_dir, TILES_DIR))
+            print("NOTE: Tiled maps fetch their data, so serve the map over HTTP (e.g. python -m http.server)")
+            return [TiledPointLayer(name="Points")]
+        if timeline:
+            # Points are split by month; the page fetches the months picked on the slider
+            write_timeline_data(valid_points, build_point_rows(valid_points, derivatives, outside_ids, output_dir),
+                                output_dir)
+            print("NOTE: Timeline maps fetch their data, so serve the map over HTTP (e.g. python -m http.server)")
+            return [TimelinePointLayer(name="Points")]
+        if mode == "lazy":
+            # Marker positions and popup content live in sidecar files next to the page
+            write_point_data(build_point_rows(valid_points, derivatives, outside_ids, output_dir), output_dir)
+            print("NOTE: Lazy popups fetch their data, so serve the map over HTTP (e.g. python -m http.server)")
+            return [LazyPointLayer(name="Points")]
+        if mode == "fast":
+            rows = [row[1:] for row in build_point_rows(valid_points, derivatives, outside_ids, output_dir)]
+            return [PointLayer(rows, name="Points")]
+
+        markers = []
+        for point in valid_points:
+            id, lat, lon, description, image_path, created_at = point
+            # Points outside the boundary stay visible, but stand out
+            color = 'orange' if id in outside_ids else 'red'
     
-    # Add Leaflet.js click handler via Folium's built-in method
-    folium.JavascriptLink(
-        "https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/leaflet.js"
-    ).add_to(m)
+            if not os.path.exists(image_path):
+                print(f"WARNING: Image not found at {image_path} for point {id}")
+                img_html = f"<p>Image not found: {image_path}</p>"
+            else:
+                # Popups show the thumbnail, fullscreen the web-sized copy;
+                # fall back to the original if encoding it failed
+                thumb_path, web_path = derivatives.get(image_path, (image_path, image_path))
+                thumb_url = page_url(thumb_path, output_dir)
+                web_url = page_url(web_path, output_dir)
+        
+                # Create HTML for popup with clickable image
+                img_html = f'''
+                    <img src="{thumb_url}" 
+                         class="popup-image" 
+                         style="width:200px;" 
+                         loading="lazy"
+                         onclick="showFullscreen('{web_url}')"
+                         title="Click to view fullscreen">
+                '''
     
-    # Add a click handler using Folium's callback mechanism
-    click_handler = """
-        function (e) {
-            // Get clicked coordinates
-            var lat = e.latlng.lat.toFixed(6);
-            var lng = e.latlng.lng.toFixed(6);
-            
-            // Create a popup at the clicked location
-            L.popup()
-                .setLatLng(e.latlng)
-                .setContent("Latitude: " + lat + "<br>Longitude: " + lng)
-                .openOn(this);
-                
-            // Copy to clipboard if supported
-            if (navigator.clipboard) {
-                navigator.clipboard.writeText(lat + ", " + lng);
-                console.log("Coordinates copied to clipboard");
-            }
-        }
-    """
+            popup_html = f'''
+                <div style="width:220px;">
+                    {img_html}<br>
+                    <p>{description}</p>
+                </div>
+            '''
     
-    # Add the click handler directly to the map object
-    m.add_child(folium.LatLngPopup())
+            markers.append(folium.CircleMarker(
+                location=[lat, lon],
+                popup=folium.Popup(popup_html, max_width=250),
+                radius=5,  # Size of the circle in pixels
+                color=color,  # Circle outline color
+                fill=True,
+                fill_color=color,  # Circle fill color
+                fill_opacity=0.7,
+                weight=1  # Border weight
+            ))
+        return markers
+
+    def tour_stage(osm_load, point_validation):
+        valid_points, _ = point_validation
+        if not tour:
+            return []
+        if osm_load is None:
+            print("WARNING: No street network, skipping the walking tour")
+            return []
+        from walking_tour import TOUR_STYLE, plan_walking_tour
+
+        nodes, edges, osm_key = osm_load
+        stops, route, length = plan_walking_tour(valid_points, nodes, edges, osm_key)
+        if not route:
+            return []
+        layer = folium.FeatureGroup(name="Walking tour")
+        folium.PolyLine(route, tooltip=f"Walking tour past {len(stops)} points, {length / 1000:.1f} km",
+                        **TOUR_STYLE).add_to(layer)
+        return [layer]
+
+    def density_stage(boundary_load, point_validation):
+        if not density:
+            return None
+        boundary, _ = boundary_load
+        valid_points, _ = point_validation
+        # Streamed builds count the points batch by batch, like the page rows
+        batches = storage.iter_points() if stream else [valid_points]
+        return build_density_levels(batches, boundary.geometry.iloc[0])
+
+    def assemble_stage(base_map, mask_layer, marker_build, walking_tour, density_grid, osm_load):
+        m = base_map
+        if density_grid is not None:
+            # The density layer hides the markers while zoomed out, so they need to be one layer
+            if len(marker_build) == 1 and isinstance(marker_build[0], folium.FeatureGroup):
+                points_layer = marker_build[0]
+            else:
+                points_layer = folium.FeatureGroup(name="Points")
+                for marker in marker_build:
+                    marker.add_to(points_layer)
+                marker_build = [points_layer]
+            marker_build = marker_build + [DensityLayer(density_grid, DENSITY_MAX_ZOOM, points_layer)]
+        for element in mask_layer + marker_build + walking_tour:
+            element.add_to(m)
+        folium.LayerControl().add_to(m)
+        return m
+
+    boundary_key = file_key(boundary_geojson_path) + [simplify_tolerance]
+    # Stages that do not depend on each other run at the same time; see build_graph
+    # Streamed points are read from the database while the page is written
+    query_points_stage = points is None and not stream
+    point_source = ("points query",) if query_points_stage else ()
+    results = run_stages([
+        Stage("boundary load", boundary_stage, key=boundary_key),
+        Stage("osm load", osm_stage, key=file_key(osm_file_path) if tour else False),
+        Stage("base map", base_map_stage, ("boundary load",)),
+        Stage("mask layer", mask_stage, ("boundary load",), output_elements=True),
+        Stage("full boundary load", full_boundary_stage, key=file_key(boundary_geojson_path)),
+        Stage("point validation", validation_stage, ("full boundary load",) + point_source),
+        Stage("image derivatives", derivatives_stage, ("point validation",)),
+        Stage("marker build", marker_stage,
+              ("boundary load", "full boundary load", "point validation", "image derivatives"),
+              output_elements=True),
+        Stage("walking tour", tour_stage, ("osm load", "point validation"), output_elements=True),
+        Stage("density grid", density_stage, ("boundary load", "point validation")),
+        Stage("assemble", assemble_stage,
+              ("base map", "mask layer", "marker build", "walking tour", "density grid", "osm load")),
+    ] + ([Stage("points query", points_stage)] if query_points_stage else []), profiler=profiler)
+    m = results["assemble"]
     
     print("DEBUG: Map creation complete")
     return m
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the interactive Cologne map from map_points.db")
+    parser.add_argument("--output", default="index.html", help="Path of the generated map page")
+    parser.add_argument("--marker-mode", choices=MARKER_MODES, default="auto",
+                        help="How points are rendered; 'auto' picks 'fast' for large datasets")
+    parser.add_argument("--popups", choices=POPUP_MODES, default="inline",
+                        help="'lazy' writes popup content to points.json/points/ instead of the page")
+    parser.add_argument("--tiles", action="store_true",
+                        help="Export points and boundary as static GeoJSON tiles under tiles/ and load them per viewport")
+    parser.add_argument("--outside-points", choices=OUTSIDE_POINT_MODES, default="flag",
+                        help="Draw points outside the boundary in orange ('flag') or leave them off the map ('exclude')")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream points from the database into the page instead of loading them all at once")
+    parser.add_argument("--timeline", action="store_true",
+                        help="Write points per month under timeline/ and add a slider to pick the months shown")
+    parser.add_argument("--tour", action="store_true",
+                        help="Plan a walk past all points along the streets of data/cologne.osm and draw it on the map")
+    parser.add_argument("--density", action="store_true",
+                        help="Shade point counts per grid cell instead of drawing markers while zoomed out")
+    parser.add_argument("--since", metavar="DATE",
+                        help="Only show points created on or after DATE (e.g. 2025, 2025-03 or 2025-03-14)")
+    parser.add_argument("--until", metavar="DATE",
+                        help="Only show points created before DATE")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("SOUTH", "WEST", "NORTH", "EAST"),
+                        help="Only show points inside this bounding box")
+    parser.add_argument("--search", metavar="TEXT",
+                        help="Only show points whose description contains TEXT")
+    parser.add_argument("--boundary-query", metavar="PLACE",
+                        help="Use the boundary of PLACE from the cached Nominatim responses (see osm_cache.py) "
+                             "instead of data/cologne_boundary.json")
+    parser.add_argument("--simplify-tolerance", type=float, default=BOUNDARY_SIMPLIFY_TOLERANCE,
+                        help="Boundary simplification tolerance in degrees")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild even if nothing changed since the last build")
+    parser.add_argument("--watch", action="store_true",
+                        help="Rebuild whenever map_points.db, images/ or data/ change and serve the map locally")
+    parser.add_argument("--publish", action="store_true",
+                        help="After building, write a cache-busted, precompressed copy of the site to dist/")
+    parser.add_argument("--port", type=int, default=8000, help="Port of the --watch preview server")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print wall time, memory and output size per build phase")
+    parser.add_argument("--profile-json", metavar="PATH",
+                        help="Also write the build profile as JSON to PATH (implies --profile)")
+    args = parser.parse_args(argv)
+    if args.stream and (args.tiles or args.popups == "lazy"):
+        parser.error("--stream writes the points into the page and cannot be combined with --tiles or --popups lazy")
+    if args.stream and (args.timeline or point_filters(args)):
+        parser.error("--stream cannot be combined with --timeline, --since, --until, --bbox or --search")
+    if args.stream and args.tour:
+        parser.error("--stream does not load the points up front and cannot be combined with --tour")
+    if args.tiles and args.timeline:
+        parser.error("--tiles and --timeline cannot be combined")
+    return args
+
+def file_signature(path):
+    """[size, mtime_ns] of a file, or None if it does not exist"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def point_filters(args):
+    """The storage.query_points filters given on the command line, or None"""
+    filters = {
+        "since": args.since,
+        "until": args.until,
+        "bbox": args.bbox,
+        "text": args.search,
+    }
+    return {name: value for name, value in filters.items() if value} or None
+
+def build_map(args):
+    """Run one (incremental) build of the map page with the parsed command line options"""
+    profiler = BuildProfiler() if args.profile or args.profile_json else NullProfiler()
     try:
         print("Setting up database...")
-        # Create database if it doesn't exist
-        conn = sqlite3.connect('map_points.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS points (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL,
-                description TEXT NOT NULL,
-                image_path TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        # Create the database if it doesn't exist and migrate its schema
+        storage.get_connection()
 
-        points = get_all_points()
-        if not points:
+        filters = point_filters(args)
+        with profiler.phase("points query"):
+            if args.stream:
+                # Streamed builds read the points in batches and never hold them all
+                points = None
+                point_count = storage.count_points()
+            else:
+                points = get_all_points(filters)
+                point_count = len(points)
+        if not point_count:
             print("WARNING: No points in database. Map will have no markers.")
             print("You can add points using point_manager.py")
         
-        if not os.path.exists('data'):
-            print("ERROR: 'data' directory not found!")
-            os.makedirs('data', exist_ok=True)
-            print("Created 'data' directory - please place cologne.osm and cologne_boundary.json there")
-            return
-        
         osm_path = 'data/cologne.osm'
         boundary_path = 'data/cologne_boundary.json'
+        if args.boundary_query or not os.path.exists(boundary_path):
+            # Derive the boundary from the cached Nominatim result instead of a hand-maintained file
+            query = args.boundary_query or BOUNDARY_QUERY
+            if not args.boundary_query:
+                print(f"NOTE: {boundary_path} not found, using the boundary of {query!r} from the response cache")
+            try:
+                boundary_path = geocode(query)
+            except Exception as e:
+                print(f"ERROR: Could not look up the boundary of {query!r}: {e}")
+                print("Place cologne_boundary.json in the 'data' directory or run with network access")
+                return
+        output_path = args.output
+        output_dir = os.path.dirname(output_path) or "."
+        
+        # Compare with what the last build rendered to skip or patch the rebuild
+        with profiler.phase("manifest check"):
+            previous = load_manifest(output_path)
+            build_points = itertools.chain.from_iterable(storage.iter_points()) if args.stream else points
+            state = compute_build_state(build_points, boundary_path, {
+                "marker_mode": args.marker_mode,
+                "popup_mode": args.popups,
+                "tiles": args.tiles,
+                "outside_points": args.outside_points,
+                "stream": args.stream,
+                "timeline": args.timeline,
+                "filters": filters,
+                # The tour depends on the street network, so its changes trigger a rebuild
+                "tour": file_signature(osm_path) if args.tour else False,
+                "density": args.density,
+                "simplify_tolerance": args.simplify_tolerance,
+            }, previous, point_details=not args.stream)
+            plan = "full" if args.force or not os.path.exists(output_path) else plan_rebuild(
+                previous, state, data_only_possible=(args.popups == "lazy" or args.tiles or args.timeline)
+                and not (args.tour or args.density)
+            )
+        
+        if plan == "up-to-date":
+            print(f"{output_path} is up to date")
+            return
+        
+        if plan == "data":
+            print(f"Points changed ({describe_point_changes(previous, state)}), updating point data only")
+            with profiler.phase("point validation"):
+                points, outside_ids = validate_points(points, load_full_boundary(boundary_path), args.outside_points)
+            with profiler.phase("image derivatives"):
+                derivatives = build_image_derivatives([point[4] for point in points])
+            with profiler.phase("point data") as record:
+                rows = build_point_rows(points, derivatives, outside_ids, output_dir)
+                if args.tiles:
+                    boundary, _ = load_boundary_geometry(boundary_path, tolerance=args.simplify_tolerance)
+                    written = export_tiles(rows, boundary.geometry.iloc[0], os.path.join(output_dir, TILES_DIR))
+                elif args.timeline:
+                    written = write_timeline_data(points, rows, output_dir)
+                else:
+                    written = write_point_data(rows, output_dir)
+                record["output_bytes"] = sum(os.path.getsize(path) for path in written)
+            state["outputs"] = build_outputs(output_dir, state)
+            save_manifest(output_path, state)
+            return
         
         print(f"Creating map with:\n  OSM: {osm_path}\n  Boundary: {boundary_path}")
         map_obj = create_interactive_map(
             osm_file_path=osm_path,
-            boundary_geojson_path=boundary_path
+            boundary_geojson_path=boundary_path,
+            simplify_tolerance=args.simplify_tolerance,
+            marker_mode=args.marker_mode,
+            popup_mode=args.popups,
+            tiles=args.tiles,
+            outside_points=args.outside_points,
+            stream=args.stream,
+            timeline=args.timeline,
+            filters=filters,
+            tour=args.tour,
+            density=args.density,
+            output_dir=output_dir,
+            points=points,
+            profiler=profiler
         )
 
-        output_path = 'index.html'
         print(f"Saving map to {output_path}")
-        map_obj.save(output_path)
+        with profiler.phase("html serialization") as record:
+            if args.stream:
+                save_streaming(map_obj, output_path)
+            else:
+                map_obj.save(output_path)
+            record["output_bytes"] = os.path.getsize(output_path)
+        profiler.attribute_output(map_obj.get_root())
+        state["outputs"] = build_outputs(output_dir, state)
+        save_manifest(output_path, state)
         print(f"Map saved successfully to {output_path}")
         
     except Exception as e:
         print(f"ERROR in main function: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        if args.profile or args.profile_json:
+            profiler.print_table()
+        if args.profile_json:
+            profiler.write_json(args.profile_json)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    def build():
+        build_map(args)
+        if args.publish:
+            from publish import publish
+
+            publish(args.output)
+
+    if not args.watch:
+        build()
+        return
+
+    from build_watch import watch_and_serve
+
+    def rebuild():
+        build()
+        # --force only applies to the first build; later ones stay incremental
+        args.force = False
+
+    watch_and_serve(rebuild, os.path.dirname(args.output) or ".", os.path.basename(args.output), port=args.port)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,242 @@
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# Where osmnx writes its raw response files (one <sha1 of url>.json per request)
+OSMNX_CACHE_DIR = 'cache'
+# Other JSON files there (e.g. the build manifest) are not osmnx responses
+OSMNX_CACHE_FILE = re.compile(r'[0-9a-f]{40}\.json')
+
+RESPONSE_CACHE_DIR = os.path.join('cache', 'responses')
+RESPONSE_INDEX = 'index.db'
+
+# Least recently used responses are evicted beyond this total compressed size
+CACHE_MAX_BYTES = 20 * 1024 * 1024
+
+# Nominatim query of the city boundary used when no boundary file is given
+BOUNDARY_QUERY = "Cologne"
+
+def _normalize(query):
+    return " ".join(query.lower().split())
+
+def _entry_key(query):
+    return hashlib.sha1(_normalize(query).encode()).hexdigest()
+
+def entry_path(key, cache_dir=RESPONSE_CACHE_DIR):
+    return os.path.join(cache_dir, f"{key}.json.gz")
+
+@contextmanager
+def _index(cache_dir):
+    """Connection to the cache index, committed (or rolled back) and closed on exit"""
+    os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(cache_dir, RESPONSE_INDEX))
+    try:
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS queries (
+                query TEXT PRIMARY KEY,
+                key TEXT NOT NULL REFERENCES responses (key) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+            CREATE TABLE IF NOT EXISTS imported (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                key TEXT
+            );
+        ''')
+        conn.execute('PRAGMA foreign_keys = ON')
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def put(query, data, aliases=(), cache_dir=RESPONSE_CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    Store a response under query (and any aliases) and return its file path.
+
+    The JSON is written gzip-compressed with a fixed header, so the same
+    response always produces the same file. Least recently used entries are
+    evicted afterwards to keep the cache under max_bytes.
+    """
+    key = _entry_key(query)
+    path = entry_path(key, cache_dir)
+    content = gzip.compress(json.dumps(data, separators=(",", ":")).encode('utf-8'), compresslevel=9, mtime=0)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+    now = time.time()
+    with _index(cache_dir) as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO responses (key, bytes, created_at, last_used) VALUES (?, ?, ?, ?)',
+            (key, len(content), now, now),
+        )
+        for name in (query, *aliases):
+            conn.execute('INSERT OR REPLACE INTO queries (query, key) VALUES (?, ?)', (_normalize(name), key))
+    evict(max_bytes, cache_dir)
+    return path
+
+def lookup(query, cache_dir=RESPONSE_CACHE_DIR):
+    """File path of the cached response for query, or None; marks the entry as used"""
+    with _index(cache_dir) as conn:
+        row = conn.execute('SELECT key FROM queries WHERE query = ?', (_normalize(query),)).fetchone()
+        if row is None or not os.path.exists(entry_path(row[0], cache_dir)):
+            return None
+        conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), row[0]))
+    return entry_path(row[0], cache_dir)
+
+def read_entry(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+def evict(max_bytes=CACHE_MAX_BYTES, cache_dir=RESPONSE_CACHE_DIR):
+    """
+    Delete least recently used entries until the cache fits in max_bytes.
+
+    The most recently used entry is always kept. Returns the number of
+    entries deleted.
+    """
+    with _index(cache_dir) as conn:
+        rows = conn.execute('SELECT key, bytes FROM responses ORDER BY last_used DESC').fetchall()
+        total = 0
+        evicted = []
+        for i, (key, size) in enumerate(rows):
+            total += size
+            if i and total > max_bytes:
+                evicted.append(key)
+        for key in evicted:
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            if os.path.exists(entry_path(key, cache_dir)):
+                os.remove(entry_path(key, cache_dir))
+    if evicted:
+        print(f"Evicted {len(evicted)} cached responses to stay under {max_bytes} bytes")
+    return len(evicted)
+
+def import_osmnx_cache(source_dir=OSMNX_CACHE_DIR, cache_dir=RESPONSE_CACHE_DIR):
+    """
+    Copy the Nominatim results osmnx left in source_dir into the cache.
+
+    osmnx names its files after the request URL, so each result is indexed
+    by its display name and its place name instead ('Cologne, North
+    Rhine-Westphalia, Germany' and 'Cologne'). Files that are unchanged
+    since they were imported are skipped, unless their entry has been
+    evicted since. Returns the number of results imported.
+    """
+    with _index(cache_dir) as conn:
+        # Files without a result (key NULL) and files whose entry still exists
+        imported = dict(conn.execute(
+            'SELECT path, mtime_ns FROM imported WHERE key IS NULL OR key IN (SELECT key FROM responses)'
+        ))
+
+    count = 0
+    for path in sorted(glob.glob(os.path.join(source_dir, '*.json'))):
+        if not OSMNX_CACHE_FILE.fullmatch(os.path.basename(path)):
+            continue
+        mtime_ns = os.stat(path).st_mtime_ns
+        if imported.get(path) == mtime_ns:
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        # Nominatim returns a list of places; other osmnx responses (Overpass) are left alone
+        key = None
+        if isinstance(data, list) and data and isinstance(data[0], dict) and 'display_name' in data[0]:
+            aliases = [data[0]['name']] if data[0].get('name') else []
+            put(data[0]['display_name'], data, aliases, cache_dir)
+            key = _entry_key(data[0]['display_name'])
+            count += 1
+        with _index(cache_dir) as conn:
+            conn.execute('INSERT OR REPLACE INTO imported (path, mtime_ns, key) VALUES (?, ?, ?)', (path, mtime_ns, key))
+    if count:
+        print(f"Imported {count} Nominatim results from {source_dir} into {cache_dir}")
+    return count
+
+def geocode(query, offline=False, cache_dir=RESPONSE_CACHE_DIR):
+    """
+    File path of the cached Nominatim result for query, looking it up on a miss.
+
+    Misses first check the raw osmnx cache; only then is Nominatim asked via
+    osmnx (whose own uncompressed cache is bypassed). With offline set, a
+    miss raises LookupError instead.
+    """
+    path = lookup(query, cache_dir)
+    if path is None and import_osmnx_cache(cache_dir=cache_dir):
+        path = lookup(query, cache_dir)
+    if path is not None:
+        return path
+    if offline:
+        raise LookupError(f"No cached response for {query!r} and offline lookups are disabled")
+
+    import osmnx as ox
+
+    print(f"Geocoding {query!r} with Nominatim")
+    use_cache = ox.settings.use_cache
+    ox.settings.use_cache = False
+    try:
+        gdf = ox.geocode_to_gdf(query)
+    finally:
+        ox.settings.use_cache = use_cache
+    return put(query, json.loads(gdf.to_json()), cache_dir=cache_dir)
+
+def entry_geometry(data):
+    """
+    Shapely geometry of a cached response: the first place of a Nominatim
+    result or the first feature of a GeoJSON FeatureCollection.
+    """
+    from shapely.geometry import shape
+
+    if isinstance(data, list):
+        geometry = data[0].get('geojson') if data else None
+    else:
+        features = data.get('features') or [{}]
+        geometry = features[0].get('geometry')
+    if not geometry or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+        raise ValueError("Cached response has no boundary polygon")
+    return shape(geometry)
+
+def list_entries(cache_dir=RESPONSE_CACHE_DIR):
+    """(key, bytes, last_used, [queries]) of all entries, most recently used first"""
+    with _index(cache_dir) as conn:
+        rows = conn.execute('SELECT key, bytes, last_used FROM responses ORDER BY last_used DESC').fetchall()
+        queries = {}
+        for query, key in conn.execute('SELECT query, key FROM queries ORDER BY query'):
+            queries.setdefault(key, []).append(query)
+    return [(key, size, last_used, queries.get(key, [])) for key, size, last_used in rows]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the compressed cache of osmnx/Nominatim responses")
+    parser.add_argument("command", choices=["list", "import", "evict", "geocode"],
+                        help="'import' compresses the raw osmnx cache files, 'geocode' looks up --query")
+    parser.add_argument("--query", default=BOUNDARY_QUERY, help="Place to geocode")
+    parser.add_argument("--max-bytes", type=int, default=CACHE_MAX_BYTES, help="Size limit for 'evict'")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        import_osmnx_cache()
+    elif args.command == "evict":
+        evict(args.max_bytes)
+    elif args.command == "geocode":
+        path = geocode(args.query)
+        print(f"{args.query}: {path} ({entry_geometry(read_entry(path)).geom_type})")
+    for key, size, last_used, queries in list_entries():
+        used = time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))
+        print(f"{key}  {size:>8} bytes  used {used}  {'; '.join(queries)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import json
+import os
+from pathlib import Path
+
+# Above this many points all markers are sent as one data array instead of
+# one folium.CircleMarker/Popup JS block per row
+FAST_MARKER_THRESHOLD = 1000
+
+MARKER_MODES = ("auto", "markers", "fast")
+
+POPUP_MODES = ("inline", "lazy")
+
+# Lazy popups are grouped into files of this many point ids
+POPUP_SHARD_SIZE = 500
+
+POINT_DATA_FILE = "points.json"
+POPUP_SHARD_DIR = "points"
+
+# Per-month point files for the timeline slider
+TIMELINE_DIR = "timeline"
+TIMELINE_INDEX_FILE = "index.json"
+
+def choose_marker_mode(mode, point_count, threshold=FAST_MARKER_THRESHOLD):
+    """Resolve 'auto' to 'markers' or 'fast' depending on the point count"""
+    if mode not in MARKER_MODES:
+        raise ValueError(f"Unknown marker mode: {mode} (expected one of {', '.join(MARKER_MODES)})")
+    if mode == "auto":
+        return "fast" if point_count > threshold else "markers"
+    return mode
+
+def page_url(path, output_dir="."):
+    """URL of a file for a page written to output_dir, e.g. ../images/a.jpg"""
+    return Path(os.path.relpath(path, output_dir)).as_posix()
+
+def build_point_rows(points, derivatives, outside_ids=frozenset(), output_dir="."):
+    """
+    Turn database rows into compact [id, lat, lon, description, thumb_url, web_url, outside]
+    rows for the data-array point layers; image URLs are relative to the page
+    in output_dir and None for missing images, and outside is 1 for points
+    flagged as lying outside the boundary.
+    """
+    rows = []
+    # Many points share an image, so resolve each image path only once
+    urls = {}
+    for point in points:
+        id, lat, lon, description, image_path, created_at = point
+        outside = 1 if id in outside_ids else 0
+        if image_path not in urls:
+            if os.path.exists(image_path):
+                thumb_path, web_path = derivatives.get(image_path, (image_path, image_path))
+                urls[image_path] = (page_url(thumb_path, output_dir), page_url(web_path, output_dir))
+            else:
+                urls[image_path] = None
+        if urls[image_path] is None:
+            print(f"WARNING: Image not found at {image_path} for point {id}")
+            rows.append([id, lat, lon, description, None, None, outside])
+            continue
+        rows.append([id, lat, lon, description, *urls[image_path], outside])
+    return rows
+
+def popup_shard(point_id, shard_size=POPUP_SHARD_SIZE):
+    """Index of the popup shard file holding a point id"""
+    return point_id // shard_size
+
+def write_if_changed(path, content):
+    """Write content to path unless the file already holds exactly that; True if written"""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+def write_point_data(rows, output_dir=".", shard_size=POPUP_SHARD_SIZE):
+    """
+    Write the sidecar files used by LazyPointLayer.
+
+    rows are [id, lat, lon, description, thumb_url, web_url, outside].
+    points.json gets the marker positions (with a trailing 1 for flagged
+    points), points/<shard>.json the popup content keyed by id. Files whose
+    content is unchanged are not rewritten and shards that no longer hold
+    any point are removed. Returns the list of files written.
+    """
+    shards = {}
+    for point_id, lat, lon, description, thumb_url, web_url, outside in rows:
+        shards.setdefault(popup_shard(point_id, shard_size), {})[point_id] = [description, thumb_url, web_url]
+
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    index_path = os.path.join(output_dir, POINT_DATA_FILE)
+    index = {
+        "shard_size": shard_size,
+        "points": [[row[0], row[1], row[2]] + ([1] if row[6] else []) for row in rows],
+    }
+    if write_if_changed(index_path, json.dumps(index, separators=(",", ":"))):
+        written.append(index_path)
+
+    shard_dir = os.path.join(output_dir, POPUP_SHARD_DIR)
+    os.makedirs(shard_dir, exist_ok=True)
+    for shard, entries in shards.items():
+        shard_path = os.path.join(shard_dir, f"{shard}.json")
+        if write_if_changed(shard_path, json.dumps(entries, separators=(",", ":"), ensure_ascii=False)):
+            written.append(shard_path)
+
+    for name in os.listdir(shard_dir):
+        stem, ext = os.path.splitext(name)
+        if ext == ".json" and stem.isdigit() and int(stem) not in shards:
+            os.remove(os.path.join(shard_dir, name))
+
+    print(f"Lazy point data for {len(rows)} points in {len(shards)} popup shards: {len(written)} files updated in {output_dir}")
+    return written
+
+def point_month(created_at):
+    """'YYYY-MM' of a created_at timestamp, or None for undated points"""
+    return str(created_at)[:7] if created_at else None
+
+def write_timeline_data(points, rows, output_dir="."):
+    """
+    Write the per-month files used by TimelinePointLayer.
+
+    points are the database rows and rows the matching build_point_rows
+    output, in the same order. timeline/<YYYY-MM>.json gets the rows of the
+    points created in that month and timeline/index.json lists the months
+    with their point counts, so the page only fetches the months selected on
+    the slider. Undated points are left out. Unchanged files are not
+    rewritten and months without points are removed. Returns the list of
+    files written.
+    """
+    months = {}
+    for point, row in zip(points, rows):
+        month = point_month(point[5])
+        if month is not None:
+            months.setdefault(month, []).append(row)
+
+    timeline_dir = os.path.join(output_dir, TIMELINE_DIR)
+    os.makedirs(timeline_dir, exist_ok=True)
+    written = []
+    index = {"months": [[month, len(months[month])] for month in sorted(months)]}
+    index_path = os.path.join(timeline_dir, TIMELINE_INDEX_FILE)
+    if write_if_changed(index_path, json.dumps(index, separators=(",", ":"))):
+        written.append(index_path)
+
+    for month, month_rows in months.items():
+        month_path = os.path.join(timeline_dir, f"{month}.json")
+        if write_if_changed(month_path, json.dumps(month_rows, separators=(",", ":"), ensure_ascii=False)):
+            written.append(month_path)
+
+    for name in os.listdir(timeline_dir):
+        stem, ext = os.path.splitext(name)
+        if ext == ".json" and name != TIMELINE_INDEX_FILE and stem not in months:
+            os.remove(os.path.join(timeline_dir, name))
+
+    undated = len(points) - sum(len(month_rows) for month_rows in months.values())
+    print(f"Timeline data for {len(points) - undated} points in {len(months)} months: "
+          f"{len(written)} files updated in {timeline_dir}"
+          + (f" ({undated} undated points left out)" if undated else ""))
+    return written
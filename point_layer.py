@@ -0,0 +1,537 @@
+import folium
+from folium.template import Template
+
+from point_data import POINT_DATA_FILE, POPUP_SHARD_DIR, TIMELINE_DIR, TIMELINE_INDEX_FILE
+from tile_export import TILES_DIR
+
+MARKER_STYLE = {
+    "radius": 5,
+    "color": "red",
+    "fill": True,
+    "fillColor": "red",
+    "fillOpacity": 0.7,
+    "weight": 1,
+}
+
+# Points outside the boundary, kept on the map with --outside-points flag
+FLAGGED_MARKER_STYLE = dict(MARKER_STYLE, color="orange", fillColor="orange")
+
+BOUNDARY_STYLE = {
+    "fillColor": "transparent",
+    "color": "grey",
+    "weight": 2,
+}
+
+# Shared by both layers: builds the popup from [description, thumb_url, web_url]
+_POPUP_HTML_JS = """
+                function escapeHtml(text) {
+                    var div = document.createElement('div');
+                    div.textContent = text;
+                    return div.innerHTML;
+                }
+
+                function popupHtml(entry) {
+                    var img = entry[1]
+                        ? '<img src="' + entry[1] + '" class="popup-image" style="width:200px;" loading="lazy"'
+                          + ' onclick="showFullscreen(\\'' + entry[2] + '\\')" title="Click to view fullscreen">'
+                        : '<p>Image not found</p>';
+                    return '<div style="width:220px;">' + img + '<br><p>' + escapeHtml(entry[0]) + '</p></div>';
+                }
+"""
+
+class PointLayer(folium.FeatureGroup):
+    """
+    Render all points from one compact data array.
+
+    Each row is [lat, lon, description, thumbnail_url, fullscreen_url, outside];
+    the image URLs are null when the image is missing and rows with outside
+    set use flagged_style. Markers are created in a
+    single JS loop with a shared style and the popup HTML is only built when
+    a popup is opened.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            (function(layer) {
+                var rows = {{ this.rows|tojson }};
+                var style = {{ this.marker_style|tojson }};
+                var flaggedStyle = {{ this.flagged_style|tojson }};
+""" + _POPUP_HTML_JS + """
+                rows.forEach(function(row) {
+                    L.circleMarker([row[0], row[1]], row[5] ? flaggedStyle : style)
+                        .bindPopup(function() { return popupHtml(row.slice(2)); }, {maxWidth: 250})
+                        .addTo(layer);
+                });
+            })({{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, rows, name="Points", marker_style=None, flagged_style=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self._name = "PointLayer"
+        self.rows = rows
+        self.marker_style = marker_style or MARKER_STYLE
+        self.flagged_style = flagged_style or FLAGGED_MARKER_STYLE
+
+class StreamedPointLayer(PointLayer):
+    """
+    PointLayer whose rows are written straight to the output file.
+
+    The template renders a placeholder in place of the rows array, which
+    html_stream.save_streaming replaces with rows read from row_source,
+    an iterable of row batches, while the page is written.
+    """
+
+    def __init__(self, row_source, name="Points", marker_style=None, flagged_style=None, **kwargs):
+        super().__init__(None, name=name, marker_style=marker_style, flagged_style=flagged_style, **kwargs)
+        self._name = "StreamedPointLayer"
+        self.rows = f"__rows_{self.get_name()}__"
+        self.row_source = row_source
+
+class LazyPointLayer(folium.FeatureGroup):
+    """
+    Render points from the sidecar files written by write_point_data.
+
+    The page itself holds no point data: marker positions are fetched from
+    data_url once the map loads, and each popup fetches its shard of
+    descriptions and image URLs the first time it is opened.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            (function(layer) {
+                var dataUrl = {{ this.data_url|tojson }};
+                var shardUrl = {{ this.shard_url|tojson }};
+                var style = {{ this.marker_style|tojson }};
+                var flaggedStyle = {{ this.flagged_style|tojson }};
+                var shards = {};
+""" + _POPUP_HTML_JS + """
+                function loadShard(shard) {
+                    if (!shards[shard]) {
+                        shards[shard] = fetch(shardUrl.replace('{shard}', shard)).then(function(response) {
+                            return response.json();
+                        });
+                    }
+                    return shards[shard];
+                }
+
+                fetch(dataUrl).then(function(response) {
+                    return response.json();
+                }).then(function(data) {
+                    data.points.forEach(function(point) {
+                        var marker = L.circleMarker([point[1], point[2]], point[3] ? flaggedStyle : style)
+                            .bindPopup('Loading...', {maxWidth: 250})
+                            .addTo(layer);
+                        marker.on('popupopen', function() {
+                            loadShard(Math.floor(point[0] / data.shard_size)).then(function(shard) {
+                                marker.setPopupContent(popupHtml(shard[point[0]]));
+                            }).catch(function(error) {
+                                console.error("Could not load popup for point " + point[0], error);
+                                marker.setPopupContent('<p>Could not load point details</p>');
+                            });
+                        });
+                    });
+                }).catch(function(error) {
+                    console.error("Could not load point data from " + dataUrl, error);
+                });
+            })({{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, data_url=POINT_DATA_FILE, shard_url=POPUP_SHARD_DIR + "/{shard}.json",
+                 name="Points", marker_style=None, flagged_style=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self._name = "LazyPointLayer"
+        self.data_url = data_url
+        self.shard_url = shard_url
+        self.marker_style = marker_style or MARKER_STYLE
+        self.flagged_style = flagged_style or FLAGGED_MARKER_STYLE
+
+class TiledPointLayer(folium.FeatureGroup):
+    """
+    Render points and the boundary outline from static GeoJSON tiles.
+
+    The tiles are written by tile_export.export_tiles. Only the tiles that
+    cover the current viewport are fetched, at the map zoom clamped to the
+    exported zoom range, and tiles already loaded are kept until the data
+    zoom changes. Below the highest zoom, merged points are drawn larger
+    and zoom in when clicked; single points fetch their popup from the
+    highest-zoom tile that holds it.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            (function(layer) {
+                var tilesUrl = {{ this.tiles_url|tojson }};
+                var style = {{ this.marker_style|tojson }};
+                var flaggedStyle = {{ this.flagged_style|tojson }};
+                var boundaryStyle = {{ this.boundary_style|tojson }};
+                var loaded = {};
+                var dataZoom = null;
+                var detailZoom = null;
+                var details = {};
+""" + _POPUP_HTML_JS + """
+                function tileXY(latlng, z) {
+                    var n = Math.pow(2, z);
+                    var lat = Math.max(Math.min(latlng.lat, 85.0511), -85.0511) * Math.PI / 180;
+                    var x = Math.floor((latlng.lng + 180) / 360 * n);
+                    var y = Math.floor((1 - Math.log(Math.tan(lat) + 1 / Math.cos(lat)) / Math.PI) / 2 * n);
+                    return [Math.min(Math.max(x, 0), n - 1), Math.min(Math.max(y, 0), n - 1)];
+                }
+
+                function fetchTile(z, key) {
+                    return fetch(tilesUrl + '/' + z + '/' + key + '.json').then(function(response) {
+                        return response.json();
+                    });
+                }
+
+                // Popup content of a point, from the detail tile that holds it
+                function detailPopup(properties) {
+                    if (!details[properties.t]) {
+                        details[properties.t] = fetchTile(detailZoom, properties.t).then(function(data) {
+                            var popups = {};
+                            data.features.forEach(function(feature) {
+                                if (feature.properties.p) {
+                                    popups[feature.properties.id] = feature.properties.p;
+                                }
+                            });
+                            return popups;
+                        });
+                    }
+                    return details[properties.t].then(function(popups) {
+                        return popups[properties.id];
+                    });
+                }
+
+                function addTile(data) {
+                    L.geoJSON(data, {
+                        style: function() { return boundaryStyle; },
+                        pointToLayer: function(feature, latlng) {
+                            var markerStyle = feature.properties.o ? flaggedStyle : style;
+                            if (feature.properties.n) {
+                                var radius = markerStyle.radius + 2 * Math.log2(feature.properties.n);
+                                return L.circleMarker(latlng, Object.assign({}, markerStyle, {radius: radius}))
+                                    .bindTooltip(feature.properties.n + ' points');
+                            }
+                            return L.circleMarker(latlng, markerStyle);
+                        },
+                        onEachFeature: function(feature, featureLayer) {
+                            var properties = feature.properties;
+                            if (properties.p) {
+                                featureLayer.bindPopup(function() {
+                                    return popupHtml(properties.p);
+                                }, {maxWidth: 250});
+                            } else if (properties.n) {
+                                featureLayer.on('click', function(e) {
+                                    layer._map.setView(e.latlng, Math.min(dataZoom + 2, detailZoom));
+                                });
+                            } else if (properties.t) {
+                                featureLayer.on('click', function() {
+                                    if (featureLayer.getPopup()) {
+                                        return;
+                                    }
+                                    detailPopup(properties).then(function(popup) {
+                                        if (popup) {
+                                            featureLayer.bindPopup(popupHtml(popup), {maxWidth: 250}).openPopup();
+                                        }
+                                    }).catch(function(error) {
+                                        console.error("Could not load point details", error);
+                                    });
+                                });
+                            }
+                        }
+                    }).addTo(layer);
+                }
+
+                fetch(tilesUrl + '/index.json').then(function(response) {
+                    return response.json();
+                }).then(function(index) {
+                    var available = {};
+                    detailZoom = index.max_zoom;
+                    Object.keys(index.tiles).forEach(function(z) {
+                        available[z] = new Set(index.tiles[z]);
+                    });
+
+                    function update() {
+                        var map = layer._map;
+                        if (!map) {
+                            return;
+                        }
+                        var z = Math.min(Math.max(Math.round(map.getZoom()), index.min_zoom), index.max_zoom);
+                        if (z !== dataZoom) {
+                            layer.clearLayers();
+                            loaded = {};
+                            dataZoom = z;
+                        }
+                        var bounds = map.getBounds();
+                        var topLeft = tileXY(bounds.getNorthWest(), z);
+                        var bottomRight = tileXY(bounds.getSouthEast(), z);
+                        for (var x = topLeft[0]; x <= bottomRight[0]; x++) {
+                            for (var y = topLeft[1]; y <= bottomRight[1]; y++) {
+                                var key = x + '/' + y;
+                                if (loaded[key] || !available[z] || !available[z].has(key)) {
+                                    continue;
+                                }
+                                loaded[key] = true;
+                                fetchTile(z, key).then(function(tileZoom, data) {
+                                    if (tileZoom === dataZoom) {
+                                        addTile(data);
+                                    }
+                                }.bind(null, z)).catch(function(error) {
+                                    console.error("Could not load tile", error);
+                                });
+                            }
+                        }
+                    }
+
+                    var attached = false;
+                    function attach() {
+                        if (layer._map && !attached) {
+                            layer._map.on('moveend', update);
+                            attached = true;
+                        }
+                        update();
+                    }
+                    layer.on('add', attach);
+                    attach();
+                }).catch(function(error) {
+                    console.error("Could not load tile index from " + tilesUrl, error);
+                });
+            })({{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, tiles_url=TILES_DIR, name="Points", marker_style=None, flagged_style=None,
+                 boundary_style=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self._name = "TiledPointLayer"
+        self.tiles_url = tiles_url
+        self.marker_style = marker_style or MARKER_STYLE
+        self.flagged_style = flagged_style or FLAGGED_MARKER_STYLE
+        self.boundary_style = boundary_style or BOUNDARY_STYLE
+
+class TimelinePointLayer(folium.FeatureGroup):
+    """
+    Render points month by month, selected with a timeline slider.
+
+    The month files are written by point_data.write_timeline_data. The
+    slider picks a range of months from the timeline index; only the months
+    in that range are fetched (once each) and shown, so e.g. one year of
+    points can be browsed without loading the rest.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            (function(layer) {
+                var timelineUrl = {{ this.timeline_url|tojson }};
+                var indexFile = {{ this.index_file|tojson }};
+                var style = {{ this.marker_style|tojson }};
+                var flaggedStyle = {{ this.flagged_style|tojson }};
+                var monthLayers = {};
+""" + _POPUP_HTML_JS + """
+                function loadMonth(month) {
+                    if (!monthLayers[month]) {
+                        monthLayers[month] = fetch(timelineUrl + '/' + month + '.json').then(function(response) {
+                            return response.json();
+                        }).then(function(rows) {
+                            var group = L.featureGroup();
+                            rows.forEach(function(row) {
+                                L.circleMarker([row[1], row[2]], row[6] ? flaggedStyle : style)
+                                    .bindPopup(function() { return popupHtml(row.slice(3)); }, {maxWidth: 250})
+                                    .addTo(group);
+                            });
+                            return group;
+                        });
+                    }
+                    return monthLayers[month];
+                }
+
+                fetch(timelineUrl + '/' + indexFile).then(function(response) {
+                    return response.json();
+                }).then(function(index) {
+                    var months = index.months;
+                    if (!months.length) {
+                        return;
+                    }
+                    var control = L.control({position: 'bottomright'});
+                    control.onAdd = function() {
+                        var div = L.DomUtil.create('div', 'timeline-control');
+                        div.innerHTML = '<strong>Found between</strong><br>'
+                            + '<input type="range" class="timeline-from" min="0" max="' + (months.length - 1) + '" value="0"><br>'
+                            + '<input type="range" class="timeline-to" min="0" max="' + (months.length - 1) + '" value="' + (months.length - 1) + '"><br>'
+                            + '<span class="timeline-label"></span>';
+                        L.DomEvent.disableClickPropagation(div);
+                        return div;
+                    };
+                    control.addTo({{ this._parent.get_name() }});
+                    var container = control.getContainer();
+                    var from = container.querySelector('.timeline-from');
+                    var to = container.querySelector('.timeline-to');
+                    var label = container.querySelector('.timeline-label');
+
+                    function range() {
+                        return [Math.min(+from.value, +to.value), Math.max(+from.value, +to.value)];
+                    }
+
+                    function isSelected(month) {
+                        var bounds = range();
+                        return month >= months[bounds[0]][0] && month <= months[bounds[1]][0];
+                    }
+
+                    function showLabel() {
+                        var bounds = range();
+                        var count = 0;
+                        for (var i = bounds[0]; i <= bounds[1]; i++) {
+                            count += months[i][1];
+                        }
+                        label.textContent = months[bounds[0]][0] + ' to ' + months[bounds[1]][0] + ' (' + count + ' points)';
+                    }
+
+                    function update() {
+                        showLabel();
+                        Object.keys(monthLayers).forEach(function(month) {
+                            if (!isSelected(month)) {
+                                monthLayers[month].then(function(group) { layer.removeLayer(group); });
+                            }
+                        });
+                        var bounds = range();
+                        months.slice(bounds[0], bounds[1] + 1).forEach(function(entry) {
+                            loadMonth(entry[0]).then(function(group) {
+                                // The slider may have moved on while the month was loading
+                                if (isSelected(entry[0])) {
+                                    layer.addLayer(group);
+                                }
+                            }).catch(function(error) {
+                                console.error("Could not load points for " + entry[0], error);
+                            });
+                        });
+                    }
+
+                    from.addEventListener('input', showLabel);
+                    to.addEventListener('input', showLabel);
+                    from.addEventListener('change', update);
+                    to.addEventListener('change', update);
+                    update();
+                }).catch(function(error) {
+                    console.error("Could not load the timeline from " + timelineUrl, error);
+                });
+            })({{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, timeline_url=TIMELINE_DIR, name="Points", marker_style=None, flagged_style=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self._name = "TimelinePointLayer"
+        self.timeline_url = timeline_url
+        self.index_file = TIMELINE_INDEX_FILE
+        self.marker_style = marker_style or MARKER_STYLE
+        self.flagged_style = flagged_style or FLAGGED_MARKER_STYLE
+
+class DensityLayer(folium.FeatureGroup):
+    """
+    Shade grid cells by point count while zoomed out.
+
+    levels come from density_grid.build_density_levels; the level for the
+    current zoom is drawn as rectangles, coloured from yellow to red on a
+    log scale of the counts. Up to max_zoom, points_layer (if given) is taken
+    off the map, so the browser draws a few hundred cells instead of every
+    marker; zooming in further or hiding this layer brings it back.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup(
+                {{ this.options|tojavascript }}
+            );
+            (function(layer, map, points) {
+                var levels = {{ this.levels|tojson }};
+                var maxZoom = {{ this.max_zoom|tojson }};
+                var levelLayers = {};
+
+                function levelFor(zoom) {
+                    var level = levels[0];
+                    levels.forEach(function(candidate) {
+                        if (candidate.zoom <= zoom) {
+                            level = candidate;
+                        }
+                    });
+                    return level;
+                }
+
+                function levelLayer(level) {
+                    if (!levelLayers[level.zoom]) {
+                        var group = L.featureGroup();
+                        var cells = level.cells;
+                        var max = 1;
+                        for (var i = 2; i < cells.length; i += 3) {
+                            max = Math.max(max, cells[i]);
+                        }
+                        for (var i = 0; i < cells.length; i += 3) {
+                            var south = level.origin[0] + cells[i] * level.size[0];
+                            var west = level.origin[1] + cells[i + 1] * level.size[1];
+                            var t = Math.log(1 + cells[i + 2]) / Math.log(1 + max);
+                            var color = 'hsl(' + Math.round(60 - 60 * t) + ', 100%, 45%)';
+                            L.rectangle([[south, west], [south + level.size[0], west + level.size[1]]], {
+                                stroke: false, fillColor: color, fillOpacity: 0.25 + 0.45 * t
+                            }).bindTooltip(cells[i + 2] + (cells[i + 2] === 1 ? ' point' : ' points')).addTo(group);
+                        }
+                        levelLayers[level.zoom] = group;
+                    }
+                    return levelLayers[level.zoom];
+                }
+
+                function update() {
+                    if (!map.hasLayer(layer)) {
+                        return;
+                    }
+                    var zoom = map.getZoom();
+                    layer.clearLayers();
+                    if (zoom <= maxZoom && levels.length) {
+                        layer.addLayer(levelLayer(levelFor(zoom)));
+                        if (points && map.hasLayer(points)) {
+                            map.removeLayer(points);
+                        }
+                    } else if (points && !map.hasLayer(points)) {
+                        map.addLayer(points);
+                    }
+                }
+
+                map.on('zoomend', update);
+                layer.on('add', function() { map.whenReady(update); });
+                layer.on('remove', function() {
+                    if (points && !map.hasLayer(points)) {
+                        map.addLayer(points);
+                    }
+                });
+            })({{ this.get_name() }}, {{ this._parent.get_name() }}, {{ this.points_layer.get_name() if this.points_layer else "null" }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, levels, max_zoom, points_layer=None, name="Point density", **kwargs):
+        super().__init__(name=name, **kwargs)
+        self._name = "DensityLayer"
+        self.levels = levels
+        self.max_zoom = max_zoom
+        self.points_layer = points_layer
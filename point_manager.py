@@ -1,66 +1,31 @@
-import sqlite3
-from pathlib import Path
-import shutil
 import os
+import storage
+from image_store import file_sha256, release_image, store_image
+from spatial_index import DUPLICATE_RADIUS_M, find_points_near, print_duplicate_report
 
 def setup_database():
-    """Create SQLite database and necessary tables"""
-    conn = sqlite3.connect('map_points.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS points (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            latitude REAL NOT NULL,
-            longitude REAL NOT NULL,
-            description TEXT NOT NULL,
-            image_path TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Create the SQLite database and bring its schema up to date"""
+    storage.get_connection()
 
-def add_point(latitude, longitude, description, image_path):
+def add_point(latitude, longitude, description, image_path, image_hash=None):
     """Add a new point to the database"""
-    conn = sqlite3.connect('map_points.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        INSERT INTO points (latitude, longitude, description, image_path)
-        VALUES (?, ?, ?, ?)
-    ''', (latitude, longitude, description, image_path))
-    
-    conn.commit()
-    conn.close()
+    return storage.insert_point(latitude, longitude, description, image_path, image_hash)
 
 def delete_point(point_id):
-    """Delete a point and its associated image"""
-    conn = sqlite3.connect('map_points.db')
-    c = conn.cursor()
+    """Delete a point and its associated image, unless another point shares it"""
+    image_hash = storage.get_image_hash(point_id)
+    point = storage.delete_point(point_id)
     
-    # First get the image path
-    c.execute('SELECT image_path FROM points WHERE id = ?', (point_id,))
-    result = c.fetchone()
-    
-    if result:
-        image_path = result[0]
-        
-        # Delete from database
-        c.execute('DELETE FROM points WHERE id = ?', (point_id,))
-        conn.commit()
-        
+    if point:
         # Delete associated image file
-        if os.path.exists(image_path):
-            os.remove(image_path)
+        if not os.path.exists(point.image_path):
+            print(f"Point {point_id} was deleted, but image file was not found.")
+        elif release_image(point.image_path, image_hash):
             print(f"Point {point_id} and its image were deleted successfully!")
         else:
-            print(f"Point {point_id} was deleted, but image file was not found.")
+            print(f"Point {point_id} was deleted; its image is kept because other points use it.")
     else:
         print(f"No point found with ID {point_id}")
-    
-    conn.close()
 
 def add_new_point():
     """Interactive function to add a new point to the database"""
@@ -70,35 +35,61 @@ def add_new_point():
     try:
         latitude = float(input("Enter latitude: "))
         longitude = float(input("Enter longitude: "))
-        description = input("Enter description (max 50 chars): ")[:50]
+        
+        merge_into = None
+        nearby = find_points_near(latitude, longitude, DUPLICATE_RADIUS_M)
+        if nearby:
+            print(f"WARNING: There are points within {DUPLICATE_RADIUS_M} m of this location:")
+            for point, distance in nearby:
+                print(f"  ID {point.id}: {distance:.1f} m away - {point.description}")
+            choice = input("Enter an ID to replace that point's image, 'new' to add a separate point, "
+                           "or press Enter to cancel: ").strip()
+            if choice.lower() == 'new':
+                pass
+            elif choice.isdigit() and int(choice) in {point.id for point, _ in nearby}:
+                merge_into = int(choice)
+            else:
+                print("Point not added.")
+                return
+        
+        if merge_into is None:
+            description = input("Enter description (max 50 chars): ")[:50]
         
         while True:
             image_path = input("Enter path to image file: ")
             if os.path.exists(image_path):
-                Path("images").mkdir(exist_ok=True)
-                file_extension = Path(image_path).suffix
-                new_filename = f"point_{latitude}_{longitude}{file_extension}"
-                new_path = os.path.join("images", new_filename)
+                image_hash = file_sha256(image_path)
+                existing = storage.points_with_image_hash(image_hash)
+                if existing:
+                    ids = ", ".join(str(point_id) for point_id in existing)
+                    print(f"WARNING: This image is already used by point(s) {ids}")
+                    if input("Add it anyway? (yes/no): ").lower() != 'yes':
+                        print("Point not added.")
+                        break
                 
-                shutil.copy2(image_path, new_path)
-                add_point(latitude, longitude, description, new_path)
-                print("Point added successfully!")
+                image_hash, new_path, is_new = store_image(image_path, image_hash)
+                if merge_into is not None:
+                    old_point = storage.get_point(merge_into)
+                    old_hash = storage.get_image_hash(merge_into)
+                    storage.update_point_image(merge_into, new_path, image_hash)
+                    if old_point.image_path != new_path:
+                        release_image(old_point.image_path, old_hash)
+                    print(f"Image of point {merge_into} replaced successfully!")
+                else:
+                    add_point(latitude, longitude, description, new_path, image_hash)
+                    print("Point added successfully!")
                 break
             else:
                 print("Image file not found. Please try again.")
                 
     except Exception as e:
         print(f"Error adding point: {e}")
-        if 'new_path' in locals() and os.path.exists(new_path):
+        if 'new_path' in locals() and is_new and os.path.exists(new_path):
             os.remove(new_path)
 
 def list_all_points():
     """List all points in the database"""
-    conn = sqlite3.connect('map_points.db')
-    c = conn.cursor()
-    
-    c.execute('SELECT * FROM points')
-    points = c.fetchall()
+    points = storage.fetch_points()
     
     if not points:
         print("\nNo points found in database.")
@@ -107,14 +98,12 @@ def list_all_points():
     print("\nAll Points")
     print("-----------")
     for point in points:
-        print(f"ID: {point[0]}")
-        print(f"Location: {point[1]}, {point[2]}")
-        print(f"Description: {point[3]}")
-        print(f"Image: {point[4]}")
-        print(f"Created: {point[5]}")
+        print(f"ID: {point.id}")
+        print(f"Location: {point.latitude}, {point.longitude}")
+        print(f"Description: {point.description}")
+        print(f"Image: {point.image_path}")
+        print(f"Created: {point.created_at}")
         print("-----------")
-    
-    conn.close()
 
 def delete_point_interactive():
     """Interactive function to delete a point"""
@@ -150,7 +139,8 @@ def main():
         print("1. Add new point")
         print("2. List all points")
         print("3. Delete a point")
-        print("4. Exit")
+        print("4. Find duplicate points")
+        print("5. Exit")
         
         choice = input("\nChoose an option: ")
         
@@ -161,6 +151,8 @@ def main():
         elif choice == "3":
             delete_point_interactive()
         elif choice == "4":
+            print_duplicate_report()
+        elif choice == "5":
             break
         else:
             print("Invalid choice. Please try again.")
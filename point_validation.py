@@ -0,0 +1,90 @@
+import argparse
+
+# 'flag' keeps points outside the boundary but draws them in a warning colour,
+# 'exclude' leaves them off the map; both report them
+OUTSIDE_POINT_MODES = ("flag", "exclude")
+
+# At most this many outliers are listed in the report
+REPORT_LIMIT = 20
+
+def _coordinate_arrays(points):
+    import numpy as np
+
+    lats = np.fromiter((point[1] for point in points), dtype=float, count=len(points))
+    lons = np.fromiter((point[2] for point in points), dtype=float, count=len(points))
+    return lats, lons
+
+def points_inside(points, boundary):
+    """
+    Boolean array telling which points lie inside (or on) the boundary polygon.
+
+    All points are tested in one vectorized call against the prepared polygon,
+    so no shapely geometry is created per point.
+    """
+    import shapely
+
+    lats, lons = _coordinate_arrays(points)
+    shapely.prepare(boundary)
+    return shapely.intersects_xy(boundary, lons, lats)
+
+def print_outside_report(points, inside, boundary, limit=REPORT_LIMIT, total=None):
+    """
+    List points outside the boundary, with a hint when lat/lon look swapped.
+
+    total is the number of points checked, when points is only a subset of them.
+    """
+    import numpy as np
+    import shapely
+
+    total = len(points) if total is None else total
+    outside = np.flatnonzero(~inside)
+    if len(outside) == 0:
+        print(f"All {total} points lie inside the boundary")
+        return
+
+    lats, lons = _coordinate_arrays([points[i] for i in outside])
+    swapped = shapely.intersects_xy(boundary, lats, lons)
+
+    print(f"WARNING: {len(outside)} of {total} points lie outside the boundary")
+    for i, is_swapped in list(zip(outside, swapped))[:limit]:
+        point = points[i]
+        hint = "  (latitude and longitude swapped?)" if is_swapped else ""
+        print(f"  ID: {point[0]}  {point[1]}, {point[2]}  {point[3]}{hint}")
+    if len(outside) > limit:
+        print(f"  ... and {len(outside) - limit} more")
+
+def validate_points(points, boundary, mode="flag"):
+    """
+    Check all points against the boundary polygon and report those outside it.
+
+    Returns (points, outside_ids): with mode 'exclude' the outliers are
+    dropped from points and outside_ids is empty, with 'flag' all points are
+    kept and outside_ids holds the ids of the outliers.
+    """
+    if mode not in OUTSIDE_POINT_MODES:
+        raise ValueError(f"Unknown outside point mode: {mode} (expected one of {', '.join(OUTSIDE_POINT_MODES)})")
+    if not points:
+        return points, frozenset()
+
+    inside = points_inside(points, boundary)
+    print_outside_report(points, inside, boundary)
+
+    if mode == "exclude":
+        return [point for point, keep in zip(points, inside) if keep], frozenset()
+    return points, frozenset(point[0] for point, keep in zip(points, inside) if not keep)
+
+def main(argv=None):
+    import storage
+    from boundary_geometry import load_full_boundary
+
+    parser = argparse.ArgumentParser(description="Report points that lie outside the Cologne boundary")
+    parser.add_argument("--boundary", default='data/cologne_boundary.json')
+    parser.add_argument("--limit", type=int, default=REPORT_LIMIT, help="Maximum number of outliers to list")
+    args = parser.parse_args(argv)
+
+    points = storage.fetch_points()
+    polygon = load_full_boundary(args.boundary)
+    print_outside_report(points, points_inside(points, polygon), polygon, args.limit)
+
+if __name__ == "__main__":
+    main()
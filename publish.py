@@ -0,0 +1,227 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import brotli
+
+from asset_bundle import HASH_LENGTH, STATIC_DIR
+from point_data import POINT_DATA_FILE, POPUP_SHARD_DIR, TIMELINE_DIR
+from tile_export import TILES_DIR
+
+DIST_DIR = 'dist'
+PUBLISH_MANIFEST = 'publish-manifest.json'
+
+# Sidecar data fetched by the page at runtime, relative to it
+DATA_PATHS = (POINT_DATA_FILE, POPUP_SHARD_DIR, TILES_DIR, TIMELINE_DIR)
+
+# The JS variables the point layers in point_layer.py keep their data URLs in
+DATA_URL_ASSIGNMENT = re.compile(r'(var (?:dataUrl|shardUrl|tilesUrl|timelineUrl) = )("(?:[^"\\]|\\.)*")')
+
+# Text files that get .gz and .br variants next to them
+COMPRESSIBLE_EXTENSIONS = ('.html', '.js', '.css', '.json')
+MIN_COMPRESS_BYTES = 1024
+
+# Image URLs in the page and data files, including JSON \u escapes of non-ASCII names. Pages
+# built outside the working directory reach the images through ../
+IMAGE_REFERENCE = re.compile(r'(?:\.\./)*images/(?:[^"\'\s()<>\\]|\\u[0-9a-fA-F]{4})+\.\w+')
+STATIC_REFERENCE = re.compile(re.escape(STATIC_DIR) + r'/map\.[0-9a-f]+\.(?:js|css)')
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _hashed_name(path, digest):
+    """images/a.jpg -> images/a.<hash>.jpg"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest[:HASH_LENGTH]}{ext}"
+
+def _read_data_files(path):
+    """{relative path: text} of a data file or of all files below a data directory"""
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+    texts = {}
+    for file_path in sorted(files):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            texts[file_path] = f.read()
+    return texts
+
+def _compressed_variants(path, content):
+    """Write path.gz and path.br; returns the paths written"""
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(content, quality=11))
+    return [path + '.gz', path + '.br']
+
+def _data_path(url):
+    """(DATA_PATHS entry, rest of the url) of a layer's data URL, or None"""
+    for name in DATA_PATHS:
+        if url == name or url.startswith(name + '/'):
+            return name, url[len(name):]
+    return None
+
+def _load_publish_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print(f"WARNING: Ignoring unreadable publish manifest {manifest_path}")
+        return {}
+
+def publish(page='index.html', dist_dir=DIST_DIR):
+    """
+    Write the map page and everything it loads to dist_dir, ready to deploy.
+
+    Images, sidecar data (points.json, points/, tiles/, timeline/) and the
+    static bundle get content-hashed names, so everything but the page can
+    be cached indefinitely; the references in the page and the data files
+    are rewritten to match; in the page only the data URLs of the point
+    layers are touched. Text files above MIN_COMPRESS_BYTES get .gz and .br
+    variants for servers that serve precompressed files.
+    dist_dir/publish-manifest.json records the hash of every file, so files
+    that did not change since the last publish are not copied again and
+    files no longer used are removed. Returns the list of files written.
+    """
+    source_dir = os.path.dirname(page) or '.'
+    with open(page, 'r', encoding='utf-8') as f:
+        html = f.read()
+
+    data_texts = {}
+    # Left-over data from builds in other modes is not referenced by the page
+    for match in DATA_URL_ASSIGNMENT.finditer(html):
+        referenced = _data_path(json.loads(match.group(2)))
+        if referenced is not None and referenced[0] not in data_texts:
+            path = os.path.join(source_dir, referenced[0])
+            if os.path.exists(path):
+                data_texts[referenced[0]] = _read_data_files(path)
+
+    # Source file (or text) of each output file, by its path relative to dist_dir
+    outputs = {}
+    missing = set()
+    image_names = {}
+
+    def rename_image(match):
+        raw = match.group(0)
+        if raw not in image_names:
+            image_path = os.path.join(source_dir, json.loads(f'"{raw}"'))
+            # The published page sits next to images/, wherever the built one was
+            url = raw.lstrip('./')
+            if not os.path.isfile(image_path):
+                missing.add(raw)
+                image_names[raw] = raw
+            else:
+                digest = _file_digest(image_path)
+                image_names[raw] = _hashed_name(url, digest)
+                outputs[_hashed_name(os.path.normpath(json.loads(f'"{url}"')), digest)] = (image_path, digest)
+        return image_names[raw]
+
+    html = IMAGE_REFERENCE.sub(rename_image, html)
+    data_names = {}
+    for name, texts in data_texts.items():
+        rewritten = {}
+        for path, text in texts.items():
+            rewritten[path] = IMAGE_REFERENCE.sub(rename_image, text).encode('utf-8')
+        tree_digest = _digest(json.dumps(
+            [[os.path.relpath(path, source_dir), _digest(content)] for path, content in rewritten.items()]
+        ).encode())
+        hashed = _hashed_name(name, tree_digest)
+        for path, content in rewritten.items():
+            relative = os.path.relpath(path, os.path.join(source_dir, name))
+            target = hashed if relative == '.' else os.path.join(hashed, relative)
+            outputs[target] = (content, _digest(content))
+        data_names[name] = hashed
+
+    def rename_data_url(match):
+        referenced = _data_path(json.loads(match.group(2)))
+        if referenced is None or referenced[0] not in data_names:
+            return match.group(0)
+        name, rest = referenced
+        return match.group(1) + json.dumps(data_names[name] + rest)
+
+    html = DATA_URL_ASSIGNMENT.sub(rename_data_url, html)
+    if missing:
+        print(f"WARNING: {len(missing)} images referenced by the page do not exist, e.g. {sorted(missing)[0]}")
+
+    for url in set(STATIC_REFERENCE.findall(html)):
+        path = os.path.join(source_dir, url)
+        if os.path.isfile(path):
+            outputs[url] = (path, _file_digest(path))
+    page_content = html.encode('utf-8')
+    outputs[os.path.basename(page)] = (page_content, _digest(page_content))
+
+    manifest_path = os.path.join(dist_dir, PUBLISH_MANIFEST)
+    previous = _load_publish_manifest(manifest_path)
+    written = []
+    copied = 0
+    unchanged = 0
+    for target, (source, digest) in sorted(outputs.items()):
+        path = os.path.join(dist_dir, target)
+        if previous.get(target) == digest and os.path.exists(path):
+            unchanged += 1
+            continue
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if isinstance(source, bytes):
+            content = source
+            with open(path, 'wb') as f:
+                f.write(content)
+        else:
+            shutil.copyfile(source, path)
+            content = None
+        written.append(path)
+        copied += 1
+        if target.endswith(COMPRESSIBLE_EXTENSIONS):
+            if content is None:
+                with open(path, 'rb') as f:
+                    content = f.read()
+            if len(content) >= MIN_COMPRESS_BYTES:
+                written.extend(_compressed_variants(path, content))
+
+    removed = 0
+    for target in previous.keys() - outputs.keys():
+        for path in (target, target + '.gz', target + '.br'):
+            path = os.path.join(dist_dir, path)
+            if os.path.exists(path):
+                os.remove(path)
+        removed += 1
+    # Remove directories emptied by the removals; os.walk's dirs lists were
+    # taken before any child was removed, so check what is left on disk
+    for root, _, _ in os.walk(dist_dir, topdown=False):
+        if root != dist_dir and not os.listdir(root):
+            os.rmdir(root)
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({target: digest for target, (_, digest) in sorted(outputs.items())}, f, indent=1)
+
+    page_path = os.path.join(dist_dir, os.path.basename(page))
+    sizes = [f"{os.path.getsize(page_path)} bytes"]
+    for ext in ('.gz', '.br'):
+        if os.path.exists(page_path + ext):
+            sizes.append(f"{os.path.getsize(page_path + ext)} {ext[1:]}")
+    print(f"Published {len(outputs)} files to {dist_dir}: {copied} copied, {unchanged} unchanged, "
+          f"{removed} removed; {os.path.basename(page)} {' / '.join(sizes)}")
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy the built map into a cache-friendly, precompressed static site")
+    parser.add_argument("--page", default="index.html", help="Built map page to publish")
+    parser.add_argument("--dist", default=DIST_DIR, help="Output directory")
+    args = parser.parse_args(argv)
+
+    publish(args.page, args.dist)
+
+if __name__ == "__main__":
+    main()
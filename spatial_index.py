@@ -0,0 +1,95 @@
+import argparse
+import math
+
+import storage
+
+EARTH_RADIUS_M = 6_371_000
+
+# Points closer than this are likely the same tag photographed twice
+DUPLICATE_RADIUS_M = 10
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two lat/lon points in metres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def _bbox_around(latitude, longitude, meters):
+    """(south, west, north, east) of a box enclosing a circle of the given radius"""
+    dlat = math.degrees(meters / EARTH_RADIUS_M)
+    dlon = math.degrees(meters / (EARTH_RADIUS_M * max(math.cos(math.radians(latitude)), 1e-12)))
+    return latitude - dlat, longitude - dlon, latitude + dlat, longitude + dlon
+
+def find_points_near(latitude, longitude, meters=DUPLICATE_RADIUS_M, exclude_id=None):
+    """
+    Points within the given distance, nearest first, as (Point, distance_m).
+
+    Candidates come from an R*Tree bounding-box lookup and are then filtered
+    by exact great-circle distance.
+    """
+    nearby = []
+    for point in storage.points_in_bbox(*_bbox_around(latitude, longitude, meters)):
+        if point.id == exclude_id:
+            continue
+        distance = haversine_m(latitude, longitude, point.latitude, point.longitude)
+        if distance <= meters:
+            nearby.append((point, distance))
+    return sorted(nearby, key=lambda item: item[1])
+
+def find_duplicate_clusters(meters=DUPLICATE_RADIUS_M):
+    """
+    Group points that lie within the given distance of each other.
+
+    Each point does one R*Tree lookup, so this runs in O(n log n) rather than
+    comparing every pair. Clusters are linked transitively (A near B near C)
+    and only clusters of two or more points are returned, as lists of Points
+    ordered by id.
+    """
+    points = storage.fetch_points()
+    parent = {point.id: point.id for point in points}
+
+    def find(point_id):
+        while parent[point_id] != point_id:
+            parent[point_id] = parent[parent[point_id]]
+            point_id = parent[point_id]
+        return point_id
+
+    for point in points:
+        for other, _ in find_points_near(point.latitude, point.longitude, meters, exclude_id=point.id):
+            root_a, root_b = find(point.id), find(other.id)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters = {}
+    for point in points:
+        clusters.setdefault(find(point.id), []).append(point)
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+def print_duplicate_report(meters=DUPLICATE_RADIUS_M):
+    clusters = find_duplicate_clusters(meters)
+    if not clusters:
+        print(f"No points within {meters} m of each other.")
+        return clusters
+
+    print(f"\n{len(clusters)} clusters of points within {meters} m")
+    print("-----------")
+    for cluster in clusters:
+        first = cluster[0]
+        for point in cluster:
+            distance = haversine_m(first.latitude, first.longitude, point.latitude, point.longitude)
+            print(f"ID: {point.id}  {point.latitude}, {point.longitude}  ({distance:.1f} m)  {point.description}")
+        print("-----------")
+    return clusters
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find points that are probably the same tag")
+    parser.add_argument("--radius", type=float, default=DUPLICATE_RADIUS_M,
+                        help="Maximum distance in metres between duplicates")
+    args = parser.parse_args(argv)
+
+    print_duplicate_report(args.radius)
+
+if __name__ == "__main__":
+    main()
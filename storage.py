@@ -0,0 +1,331 @@
+import sqlite3
+from typing import NamedTuple, Optional
+
+DB_PATH = 'map_points.db'
+
+POINT_COLUMNS = ('id', 'latitude', 'longitude', 'description', 'image_path', 'created_at')
+
+# Ordered schema migrations; each runs once and bumps schema_version
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS points (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            description TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, [
+        'CREATE INDEX IF NOT EXISTS idx_points_lat_lon ON points (latitude, longitude)',
+        'CREATE INDEX IF NOT EXISTS idx_points_created_at ON points (created_at)',
+    ]),
+    (3, [
+        'ALTER TABLE points ADD COLUMN image_hash TEXT',
+        'CREATE INDEX IF NOT EXISTS idx_points_image_hash ON points (image_hash)',
+    ]),
+    (4, [
+        # R*Tree over point locations, kept in sync with points by triggers
+        'CREATE VIRTUAL TABLE IF NOT EXISTS points_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)',
+        'INSERT INTO points_rtree SELECT id, latitude, latitude, longitude, longitude FROM points',
+        '''
+        CREATE TRIGGER IF NOT EXISTS points_rtree_insert AFTER INSERT ON points BEGIN
+            INSERT INTO points_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS points_rtree_update AFTER UPDATE OF latitude, longitude ON points BEGIN
+            UPDATE points_rtree SET min_lat = new.latitude, max_lat = new.latitude,
+                                    min_lon = new.longitude, max_lon = new.longitude
+            WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS points_rtree_delete AFTER DELETE ON points BEGIN
+            DELETE FROM points_rtree WHERE id = old.id;
+        END
+        ''',
+    ]),
+    (5, [
+        # Substring index over descriptions (trigram FTS5, SQLite 3.34+), kept in sync with points by triggers.
+        # Skipped where SQLite lacks it; query_points then scans with LIKE
+        "CREATE VIRTUAL TABLE IF NOT EXISTS points_fts USING fts5(description, content='points', content_rowid='id', tokenize='trigram')",
+        "INSERT INTO points_fts (points_fts) VALUES ('rebuild')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS points_fts_insert AFTER INSERT ON points BEGIN
+            INSERT INTO points_fts (rowid, description) VALUES (new.id, new.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS points_fts_update AFTER UPDATE OF description ON points BEGIN
+            INSERT INTO points_fts (points_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            INSERT INTO points_fts (rowid, description) VALUES (new.id, new.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS points_fts_delete AFTER DELETE ON points BEGIN
+            INSERT INTO points_fts (points_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        END
+        ''',
+    ]),
+]
+
+def _fts_trigram_available(conn):
+    """Whether this SQLite build has FTS5 with the trigram tokenizer (3.34+)"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(text, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute('DROP TABLE temp.fts_probe')
+    return True
+
+# Migrations that need an optional SQLite feature; where it is missing they
+# are recorded as applied without running, so callers must check their tables
+OPTIONAL_MIGRATIONS = {
+    5: _fts_trigram_available,
+}
+
+class Point(NamedTuple):
+    id: int
+    latitude: float
+    longitude: float
+    description: str
+    image_path: str
+    created_at: Optional[str]
+
+_connection = None
+_connection_path = None
+
+def _migrate(conn):
+    """Apply all migrations newer than the database's schema version"""
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    current = row[0] or 0
+
+    for version, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        available = OPTIONAL_MIGRATIONS.get(version)
+        if available is not None and not available(conn):
+            print(f"NOTE: This SQLite ({sqlite3.sqlite_version}) cannot run schema migration {version}, skipping it")
+            statements = []
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+
+def get_connection(db_path=None):
+    """
+    Return the shared connection to the points database.
+
+    The connection is opened once, switched to WAL mode so builds can read
+    while points are being added, and migrated to the latest schema. Without
+    db_path the open connection is reused, or DB_PATH is opened; passing a
+    different db_path switches the shared connection to that database.
+    """
+    global _connection, _connection_path
+
+    if _connection is not None and db_path in (None, _connection_path):
+        return _connection
+    db_path = db_path or DB_PATH
+
+    close_connection()
+    # Build stages run on worker threads; sqlite3 serializes access to the connection
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    _migrate(conn)
+
+    _connection = conn
+    _connection_path = db_path
+    return conn
+
+def close_connection():
+    """Close the shared connection, if one is open"""
+    global _connection, _connection_path
+    if _connection is not None:
+        _connection.close()
+    _connection = None
+    _connection_path = None
+
+def _select_points(where='', params=()):
+    columns = ', '.join(POINT_COLUMNS)
+    return f'SELECT {columns} FROM points {where}', params
+
+def fetch_points():
+    """Return all points, ordered by id"""
+    sql, params = _select_points('ORDER BY id')
+    return [Point._make(row) for row in get_connection().execute(sql, params)]
+
+def iter_points(batch_size=5000):
+    """
+    Yield all points, ordered by id, in lists of at most batch_size.
+
+    Rows are read from the cursor with fetchmany, so only one batch is held
+    in memory at a time.
+    """
+    sql, params = _select_points('ORDER BY id')
+    cursor = get_connection().execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [Point._make(row) for row in rows]
+
+def count_points():
+    """Number of points in the database"""
+    return get_connection().execute('SELECT COUNT(*) FROM points').fetchone()[0]
+
+def fetch_image_paths():
+    """Distinct image paths referenced by points"""
+    rows = get_connection().execute('SELECT DISTINCT image_path FROM points ORDER BY image_path')
+    return [row[0] for row in rows]
+
+def get_point(point_id):
+    """Return the point with the given id, or None"""
+    sql, params = _select_points('WHERE id = ?', (point_id,))
+    row = get_connection().execute(sql, params).fetchone()
+    return Point._make(row) if row else None
+
+def insert_point(latitude, longitude, description, image_path, image_hash=None):
+    """Insert a point and return its id"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO points (latitude, longitude, description, image_path, image_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (latitude, longitude, description, image_path, image_hash))
+    return cursor.lastrowid
+
+def insert_points(rows):
+    """
+    Insert many points in a single transaction.
+
+    rows are (latitude, longitude, description, image_path, image_hash)
+    tuples. Returns the number of rows inserted.
+    """
+    conn = get_connection()
+    with conn:
+        cursor = conn.executemany('''
+            INSERT INTO points (latitude, longitude, description, image_path, image_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+    return cursor.rowcount
+
+def fetch_image_hashes():
+    """Return {point id: (image_path, image_hash)}; image_hash is None until backfilled"""
+    rows = get_connection().execute('SELECT id, image_path, image_hash FROM points')
+    return {point_id: (image_path, image_hash) for point_id, image_path, image_hash in rows}
+
+def set_image_hashes(pairs):
+    """Store image hashes from (point id, image_hash) pairs"""
+    conn = get_connection()
+    with conn:
+        conn.executemany('UPDATE points SET image_hash = ? WHERE id = ?',
+                         [(image_hash, point_id) for point_id, image_hash in pairs])
+
+def points_with_image_hash(image_hash):
+    """Ids of the points whose image has the given content hash"""
+    rows = get_connection().execute('SELECT id FROM points WHERE image_hash = ? ORDER BY id', (image_hash,))
+    return [row[0] for row in rows]
+
+def points_with_image_path(image_path):
+    """Ids of the points referencing the given image file"""
+    rows = get_connection().execute('SELECT id FROM points WHERE image_path = ? ORDER BY id', (image_path,))
+    return [row[0] for row in rows]
+
+def set_image_locations(rows):
+    """Update image_path and image_hash from (image_path, image_hash, point id) rows"""
+    conn = get_connection()
+    with conn:
+        conn.executemany('UPDATE points SET image_path = ?, image_hash = ? WHERE id = ?', rows)
+
+def get_image_hash(point_id):
+    """Content hash of a point's image, or None if unknown"""
+    row = get_connection().execute('SELECT image_hash FROM points WHERE id = ?', (point_id,)).fetchone()
+    return row[0] if row else None
+
+def points_in_bbox(south, west, north, east):
+    """Points inside a lat/lon bounding box, looked up through the R*Tree"""
+    columns = ', '.join(f'p.{column}' for column in POINT_COLUMNS)
+    rows = get_connection().execute(f'''
+        SELECT {columns} FROM points_rtree r JOIN points p ON p.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+        ORDER BY p.id
+    ''', (south, north, west, east))
+    return [Point._make(row) for row in rows]
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def _date_bound(value):
+    """
+    A created_at comparison value. created_at has NUMERIC affinity, so a bare
+    year would be compared as a number; '2025-' sorts just before '2025-01'.
+    """
+    value = str(value)
+    return value + '-' if value.isdigit() else value
+
+def query_points(since=None, until=None, bbox=None, text=None):
+    """
+    Points matching all of the given filters, ordered by id.
+
+    since and until bound created_at (since inclusive, until exclusive) and
+    may be a year, a month or a full timestamp: '2025', '2025-03',
+    '2025-03-14 12:00:00'. bbox is (south, west, north, east) and is looked
+    up through the R*Tree; text is matched case-insensitively anywhere in
+    the description through the trigram index ('brücke' finds
+    'Südbrücke'). Texts shorter than three characters, and databases
+    without the index (SQLite before 3.34), fall back to a scan.
+    """
+    conn = get_connection()
+    joins = []
+    where = []
+    params = []
+    if bbox is not None:
+        south, west, north, east = bbox
+        joins.append('JOIN points_rtree r ON r.id = p.id')
+        where.append('r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?')
+        params.extend([south, north, west, east])
+    if text and len(text) >= 3 and _has_table(conn, 'points_fts'):
+        joins.append('JOIN points_fts f ON f.rowid = p.id')
+        where.append('points_fts MATCH ?')
+        # Quoted as one phrase, so the text is matched literally
+        params.append('"' + text.replace('"', '""') + '"')
+    elif text:
+        where.append("p.description LIKE ? ESCAPE '\\'")
+        params.append('%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if since:
+        where.append('p.created_at >= ?')
+        params.append(_date_bound(since))
+    if until:
+        where.append('p.created_at < ?')
+        params.append(_date_bound(until))
+
+    columns = ', '.join(f'p.{column}' for column in POINT_COLUMNS)
+    sql = f'SELECT {columns} FROM points p {" ".join(joins)}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    rows = conn.execute(sql + ' ORDER BY p.id', params)
+    return [Point._make(row) for row in rows]
+
+def update_point_image(point_id, image_path, image_hash):
+    """Point an existing point at a different image"""
+    conn = get_connection()
+    with conn:
+        conn.execute('UPDATE points SET image_path = ?, image_hash = ? WHERE id = ?',
+                     (image_path, image_hash, point_id))
+
+def delete_point(point_id):
+    """Delete a point and return the deleted Point, or None if it did not exist"""
+    point = get_point(point_id)
+    if point is None:
+        return None
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM points WHERE id = ?', (point_id,))
+    return point
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import time
+
+OSM_CACHE_DIR = os.path.join('cache', 'osm')
+
+# {OSM file path: [size, mtime_ns, content hash]}, so unchanged files are not hashed again
+OSM_KEY_INDEX = 'keys.json'
+
+
+def _load_key_index(index_path):
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+
+def osm_file_key(osm_file_path, cache_dir=OSM_CACHE_DIR):
+    """
+    Return a cache key built from the OSM file's content hash.
+
+    The hash is remembered together with the file's size and mtime, and the
+    file is only read again when one of those changed.
+    """
+    stat = os.stat(osm_file_path)
+    index_path = os.path.join(cache_dir, OSM_KEY_INDEX)
+    index = _load_key_index(index_path)
+    entry = index.get(os.path.abspath(osm_file_path))
+    if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+        return entry[2]
+
+    digest = hashlib.sha1()
+    with open(osm_file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    key = digest.hexdigest()
+
+    index[os.path.abspath(osm_file_path)] = [stat.st_size, stat.st_mtime_ns, key]
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_atomic(index_path, lambda path: _dump_json(index, path))
+    return key
+
+
+def _dump_json(data, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def _write_atomic(path, write):
+    """Call write(tmp_path) and move the result into place, so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _stringify_mixed_columns(gdf):
+    """Parquet cannot store the mixed list/scalar columns osmnx produces"""
+    gdf = gdf.copy()
+    for column in gdf.columns:
+        if column == gdf.geometry.name or gdf[column].dtype != object:
+            continue
+        value_types = set(gdf[column].dropna().map(type))
+        if len(value_types) > 1 or value_types & {list, set, dict}:
+            gdf[column] = gdf[column].map(lambda value: value if value is None else str(value))
+    return gdf
+
+
+def _cache_paths(cache_dir, key):
+    return (
+        os.path.join(cache_dir, f"{key}_nodes.parquet"),
+        os.path.join(cache_dir, f"{key}_edges.parquet"),
+        os.path.join(cache_dir, f"{key}.json"),
+    )
+
+
+def load_street_network(osm_file_path, cache_dir=OSM_CACHE_DIR):
+    """
+    Load the street network of an OSM file as (nodes, edges) GeoDataFrames.
+
+    The first load parses the XML with osmnx and stores both frames as
+    GeoParquet under cache_dir; later loads of the same file read the cache.
+    """
+    import geopandas as gpd
+
+    if not os.path.exists(osm_file_path):
+        print(f"ERROR: OSM file not found at {osm_file_path}")
+        raise FileNotFoundError(f"OSM file not found: {osm_file_path}")
+
+    key = osm_file_key(osm_file_path, cache_dir)
+    nodes_path, edges_path, meta_path = _cache_paths(cache_dir, key)
+
+    if os.path.exists(nodes_path) and os.path.exists(edges_path):
+        start = time.perf_counter()
+        nodes = gpd.read_parquet(nodes_path)
+        edges = gpd.read_parquet(edges_path)
+        elapsed = time.perf_counter() - start
+
+        cold_seconds = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                cold_seconds = json.load(f).get("parse_seconds")
+        cold_text = f"{cold_seconds:.2f}s" if cold_seconds is not None else "unknown"
+        print(f"Street network cache hit for {osm_file_path}: {elapsed:.2f}s (cold parse took {cold_text})")
+        return nodes, edges
+
+    import osmnx as ox
+
+    print(f"DEBUG: Parsing OSM data from {osm_file_path}")
+    start = time.perf_counter()
+    graph = ox.graph_from_xml(osm_file_path)
+    nodes, edges = ox.graph_to_gdfs(graph)
+    elapsed = time.perf_counter() - start
+    print(f"Street network cold parse of {osm_file_path}: {elapsed:.2f}s ({len(nodes)} nodes, {len(edges)} edges)")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # The nodes are written last, since their presence marks a complete cache entry
+    _write_atomic(edges_path, _stringify_mixed_columns(edges).to_parquet)
+    _write_atomic(meta_path, lambda path: _dump_json({
+        "osm_file": osm_file_path,
+        "parse_seconds": elapsed,
+        "nodes": len(nodes),
+        "edges": len(edges),
+    }, path))
+    _write_atomic(nodes_path, _stringify_mixed_columns(nodes).to_parquet)
+
+    return nodes, edges
+
@@ -0,0 +1,198 @@
+import argparse
+import json
+import math
+import os
+
+from point_data import write_if_changed
+
+TILES_DIR = 'tiles'
+TILE_INDEX_FILE = 'index.json'
+
+# Zoomed further out the page uses MIN_TILE_ZOOM tiles, further in MAX_TILE_ZOOM
+MIN_TILE_ZOOM = 11
+MAX_TILE_ZOOM = 15
+
+# Below MAX_TILE_ZOOM, points are merged per cell of a 2**CLUSTER_ZOOM_OFFSET
+# grid over each tile (32 x 32 cells of 8 px on 256 px tiles)
+CLUSTER_ZOOM_OFFSET = 5
+
+def lonlat_to_tile(lons, lats, zoom):
+    """Slippy-map tile x/y indices for arrays of lon/lat at a zoom level"""
+    import numpy as np
+
+    n = 2 ** zoom
+    lats = np.clip(np.asarray(lats, dtype=float), -85.0511, 85.0511)
+    xs = np.floor((np.asarray(lons, dtype=float) + 180.0) / 360.0 * n).astype(np.int64)
+    ys = np.floor((1.0 - np.arcsinh(np.tan(np.radians(lats))) / math.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(xs, 0, n - 1), np.clip(ys, 0, n - 1)
+
+def tile_bounds(x, y, zoom):
+    """(west, south, east, north) of a slippy-map tile"""
+    n = 2 ** zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+def _cluster_features(rows, lats, lons, zoom, detail_zoom):
+    """
+    {(x, y): [features]} of the points merged per grid cell, for zooms below
+    detail_zoom. A cell with one point keeps its id and the detail tile ("t")
+    that has its popup; larger cells only carry their mean position and
+    point count ("n"). "o" marks cells whose points are all flagged.
+    """
+    import numpy as np
+
+    cell_zoom = zoom + CLUSTER_ZOOM_OFFSET
+    cxs, cys = lonlat_to_tile(lons, lats, cell_zoom)
+    cells, first, inverse, counts = np.unique(cxs * (2 ** cell_zoom) + cys, return_index=True,
+                                              return_inverse=True, return_counts=True)
+    mean_lats = np.bincount(inverse, weights=lats) / counts
+    mean_lons = np.bincount(inverse, weights=lons) / counts
+    flagged = np.bincount(inverse, weights=[1.0 if row[6] else 0.0 for row in rows]) == counts
+    detail_xs, detail_ys = lonlat_to_tile(lons[first], lats[first], detail_zoom)
+
+    tiles = {}
+    for i, cell in enumerate(cells.tolist()):
+        tile = ((cell // 2 ** cell_zoom) >> CLUSTER_ZOOM_OFFSET, (cell % 2 ** cell_zoom) >> CLUSTER_ZOOM_OFFSET)
+        if counts[i] == 1:
+            row = rows[first[i]]
+            coordinates = [row[2], row[1]]
+            properties = {"id": row[0], "t": f"{detail_xs[i]}/{detail_ys[i]}"}
+        else:
+            coordinates = [round(float(mean_lons[i]), 6), round(float(mean_lats[i]), 6)]
+            properties = {"n": int(counts[i])}
+        if flagged[i]:
+            properties["o"] = 1
+        tiles.setdefault(tile, []).append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": coordinates},
+            "properties": properties,
+        })
+    return tiles
+
+def _point_features(rows, indices):
+    features = []
+    for i in indices:
+        properties = {"id": rows[i][0], "p": rows[i][3:6]}
+        if rows[i][6]:
+            properties["o"] = 1
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [rows[i][2], rows[i][1]]},
+            "properties": properties,
+        })
+    return features
+
+def _boundary_features(boundary, zoom):
+    """{(x, y): [clipped outline features]} for the tiles the boundary outline crosses"""
+    import numpy as np
+    import shapely
+    from shapely.geometry import box, mapping
+
+    outline = boundary.boundary
+    west, south, east, north = outline.bounds
+    x_min, y_max = lonlat_to_tile([west], [south], zoom)
+    x_max, y_min = lonlat_to_tile([east], [north], zoom)
+
+    tiles = [(x, y) for x in range(int(x_min[0]), int(x_max[0]) + 1) for y in range(int(y_min[0]), int(y_max[0]) + 1)]
+    boxes = np.array([box(*tile_bounds(x, y, zoom)) for x, y in tiles])
+    clipped = shapely.set_precision(shapely.intersection(outline, boxes), 0.000001)
+
+    features = {}
+    for tile, geometry in zip(tiles, clipped):
+        if geometry.is_empty:
+            continue
+        features[tile] = [{"type": "Feature", "geometry": mapping(geometry), "properties": {"b": 1}}]
+    return features
+
+def export_tiles(rows, boundary=None, output_dir=TILES_DIR, min_zoom=MIN_TILE_ZOOM, max_zoom=MAX_TILE_ZOOM):
+    """
+    Write points (and the boundary outline) as a z/x/y tree of small GeoJSON tiles.
+
+    rows are [id, lat, lon, description, thumb_url, web_url, outside] as built
+    by point_data.build_point_rows; boundary is an optional shapely polygon.
+    Only the max_zoom tiles hold every point with its popup content; the
+    lower zooms hold the points merged per grid cell (see
+    _cluster_features), so a zoomed-out view stays small however many
+    points there are. output_dir/index.json lists the tiles that exist per
+    zoom so the page never requests empty ones. Unchanged tiles are not rewritten and tiles
+    that are no longer needed are removed. Returns the list of files written.
+    """
+    import numpy as np
+
+    lats = np.array([row[1] for row in rows], dtype=float)
+    lons = np.array([row[2] for row in rows], dtype=float)
+
+    index = {"min_zoom": min_zoom, "max_zoom": max_zoom, "tiles": {}}
+    written = []
+    expected = set()
+    feature_count = 0
+
+    for zoom in range(min_zoom, max_zoom + 1):
+        tiles = {}
+        if len(rows) and zoom < max_zoom:
+            tiles = _cluster_features(rows, lats, lons, zoom, max_zoom)
+        elif len(rows):
+            xs, ys = lonlat_to_tile(lons, lats, zoom)
+            keys = xs * (2 ** zoom) + ys
+            order = np.argsort(keys, kind="stable")
+            unique_keys, starts = np.unique(keys[order], return_index=True)
+            for key, chunk in zip(unique_keys, np.split(order, starts[1:])):
+                tiles.setdefault((int(key // 2 ** zoom), int(key % 2 ** zoom)), []).extend(_point_features(rows, chunk))
+
+        if boundary is not None:
+            for tile, features in _boundary_features(boundary, zoom).items():
+                tiles.setdefault(tile, []).extend(features)
+
+        index["tiles"][str(zoom)] = sorted(f"{x}/{y}" for x, y in tiles)
+        for (x, y), features in tiles.items():
+            path = os.path.join(output_dir, str(zoom), str(x), f"{y}.json")
+            expected.add(os.path.normpath(path))
+            feature_count += len(features)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            content = json.dumps({"type": "FeatureCollection", "features": features},
+                                 separators=(",", ":"), ensure_ascii=False)
+            if write_if_changed(path, content):
+                written.append(path)
+
+    index_path = os.path.join(output_dir, TILE_INDEX_FILE)
+    os.makedirs(output_dir, exist_ok=True)
+    if write_if_changed(index_path, json.dumps(index, separators=(",", ":"))):
+        written.append(index_path)
+
+    removed = 0
+    for dirpath, _, filenames in os.walk(output_dir):
+        for name in filenames:
+            path = os.path.normpath(os.path.join(dirpath, name))
+            if name.endswith(".json") and name != TILE_INDEX_FILE and path not in expected:
+                os.remove(path)
+                removed += 1
+
+    tile_total = sum(len(tiles) for tiles in index["tiles"].values())
+    print(f"Exported {tile_total} tiles ({feature_count} features) for zoom {min_zoom}-{max_zoom} to {output_dir}: "
+          f"{len(written)} files updated, {removed} removed")
+    return written
+
+def main(argv=None):
+    import storage
+    from boundary_geometry import load_boundary_geometry
+    from image_derivatives import build_image_derivatives
+    from point_data import build_point_rows
+
+    parser = argparse.ArgumentParser(description="Export points and the boundary as static GeoJSON tiles")
+    parser.add_argument("--output-dir", default=TILES_DIR)
+    parser.add_argument("--boundary", default='data/cologne_boundary.json')
+    parser.add_argument("--min-zoom", type=int, default=MIN_TILE_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=MAX_TILE_ZOOM)
+    args = parser.parse_args(argv)
+
+    points = storage.fetch_points()
+    derivatives = build_image_derivatives([point.image_path for point in points])
+    boundary, _ = load_boundary_geometry(args.boundary)
+    export_tiles(build_point_rows(points, derivatives), boundary.geometry.iloc[0],
+                 args.output_dir, args.min_zoom, args.max_zoom)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from image_derivatives import pool_context
+
+TOUR_CACHE_DIR = os.path.join('cache', 'tour')
+
+# Below this many new sources the shortest paths are computed in-process,
+# which beats sending the street graph to worker processes
+PARALLEL_MIN_SOURCES = 8
+
+TOUR_STYLE = {
+    "color": "#3367d6",
+    "weight": 4,
+    "opacity": 0.8,
+}
+
+# Set in each worker process by _init_worker
+_worker_graph = None
+
+def street_graph(nodes, edges):
+    """
+    Undirected networkx graph of the street network, weighted by edge length in metres.
+
+    Walkers are not bound to one-way streets, so each pair of nodes is
+    joined by its shortest edge in either direction.
+    """
+    import networkx as nx
+
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes.index)
+    u = edges.index.get_level_values('u')
+    v = edges.index.get_level_values('v')
+    for a, b, length in zip(u, v, edges['length']):
+        if a == b:
+            continue
+        if not graph.has_edge(a, b) or graph[a][b]['length'] > length:
+            graph.add_edge(a, b, length=float(length))
+    return graph
+
+def snap_points(points, nodes):
+    """
+    osmid of the street node nearest to each point.
+
+    All points are looked up in one vectorized query against an STRtree of
+    the nodes; longitudes are scaled by the cosine of the latitude so that
+    distances in the query are roughly proportional to metres.
+    """
+    import numpy as np
+    import shapely
+
+    scale = np.cos(np.radians(nodes['y'].mean()))
+    node_geometries = shapely.points(nodes['x'].to_numpy() * scale, nodes['y'].to_numpy())
+    lats = np.fromiter((point[1] for point in points), dtype=float, count=len(points))
+    lons = np.fromiter((point[2] for point in points), dtype=float, count=len(points))
+    tree = shapely.STRtree(node_geometries)
+    _, nearest = tree.query_nearest(shapely.points(lons * scale, lats), return_distance=False, all_matches=False)
+    return nodes.index.to_numpy()[nearest]
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+def _distance_rows(sources, targets, graph=None):
+    """Network distances from each source to all targets (runs in a worker process)"""
+    import networkx as nx
+    import numpy as np
+
+    graph = graph if graph is not None else _worker_graph
+    rows = np.full((len(sources), len(targets)), np.inf, dtype=np.float32)
+    for i, source in enumerate(sources):
+        lengths = nx.single_source_dijkstra_path_length(graph, source, weight='length')
+        rows[i] = [lengths.get(target, np.inf) for target in targets]
+    return rows
+
+def _chunks(items, count):
+    size = max(1, -(-len(items) // count))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _load_cached_matrix(cache_path):
+    import numpy as np
+
+    if not os.path.exists(cache_path):
+        return [], None
+    try:
+        with np.load(cache_path) as cached:
+            return cached['nodes'].tolist(), cached['distances']
+    except (OSError, ValueError, KeyError):
+        print(f"WARNING: Ignoring unreadable distance matrix cache {cache_path}")
+        return [], None
+
+def distance_matrix(graph, node_ids, cache_key, cache_dir=TOUR_CACHE_DIR, workers=None):
+    """
+    Matrix of walking distances in metres between the given street nodes.
+
+    Rows are cached on disk per street network (cache_key); on later calls
+    only the nodes that are not in the cache get a shortest-path search, so
+    adding a point costs one search instead of recomputing the whole matrix.
+    The graph is undirected, so the new rows also fill the new columns.
+    Larger batches of new nodes are spread over a process pool. Unreachable
+    pairs are inf.
+    """
+    import numpy as np
+
+    cache_path = os.path.join(cache_dir, f"{cache_key}.npz")
+    cached_nodes, cached_distances = _load_cached_matrix(cache_path)
+    cached_index = {node: i for i, node in enumerate(cached_nodes)}
+
+    node_ids = list(dict.fromkeys(node_ids))
+    new_nodes = [node for node in node_ids if node not in cached_index]
+
+    distances = np.full((len(node_ids), len(node_ids)), np.inf, dtype=np.float32)
+    known = [i for i, node in enumerate(node_ids) if node in cached_index]
+    if known:
+        rows = [cached_index[node_ids[i]] for i in known]
+        distances[np.ix_(known, known)] = cached_distances[np.ix_(rows, rows)]
+
+    start = time.perf_counter()
+    if new_nodes:
+        if len(new_nodes) < PARALLEL_MIN_SOURCES or workers == 1:
+            new_rows = _distance_rows(new_nodes, node_ids, graph)
+        else:
+            workers = workers or os.cpu_count() or 1
+            # Not forked: the tour is planned on a build worker thread
+            with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=_init_worker,
+                                     initargs=(graph,)) as executor:
+                chunks = _chunks(new_nodes, workers * 4)
+                new_rows = np.vstack(list(executor.map(_distance_rows, chunks, [node_ids] * len(chunks))))
+        new = [node_ids.index(node) for node in new_nodes]
+        distances[new, :] = new_rows
+        distances[:, new] = new_rows.T
+        # Paths found from either end can differ in rounding; the tour needs an exactly symmetric matrix
+        block = distances[np.ix_(new, new)]
+        distances[np.ix_(new, new)] = np.minimum(block, block.T)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp.npz"
+        np.savez(tmp_path, nodes=np.array(node_ids, dtype=np.int64), distances=distances)
+        os.replace(tmp_path, cache_path)
+
+    elapsed = time.perf_counter() - start
+    print(f"Distance matrix for {len(node_ids)} street nodes: {len(new_nodes)} computed, "
+          f"{len(node_ids) - len(new_nodes)} cached ({elapsed:.2f}s)")
+    return distances
+
+def tour_length(distances, order):
+    """Length of the closed tour visiting the matrix rows in the given order"""
+    import numpy as np
+
+    order = np.asarray(order)
+    return float(distances[order, np.roll(order, -1)].sum())
+
+def plan_tour(distances, start=0):
+    """
+    Approximate shortest closed tour through all rows of the distance matrix.
+
+    Starts with the nearest-neighbour tour from start and improves it with
+    2-opt moves until none shortens it; each pass tests all segment ends for
+    one segment start at once with NumPy. Returns the order of the rows,
+    beginning with start. distances must be finite and symmetric.
+    """
+    import numpy as np
+
+    distances = np.asarray(distances, dtype=float)
+    count = len(distances)
+    if count <= 3:
+        return [start] + [i for i in range(count) if i != start]
+
+    visited = np.zeros(count, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(count - 1):
+        row = np.where(visited, np.inf, distances[order[-1]])
+        nearest = int(np.argmin(row))
+        order.append(nearest)
+        visited[nearest] = True
+    order = np.array(order)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, count - 1):
+            # Reversing order[i:j + 1] replaces the edges (i-1, i) and (j, j+1)
+            j = np.arange(i + 1, count)
+            a, b = order[i - 1], order[i]
+            c, d = order[j], order[(j + 1) % count]
+            delta = distances[a, c] + distances[b, d] - distances[a, b] - distances[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-6:
+                order[i:j[best] + 1] = order[i:j[best] + 1][::-1].copy()
+                improved = True
+    return order.tolist()
+
+def route_coordinates(graph, nodes, stops):
+    """[lat, lon] of the street path that visits the stop nodes in order and returns to the first"""
+    import networkx as nx
+
+    coordinates = []
+    for a, b in zip(stops, stops[1:] + stops[:1]):
+        try:
+            path = nx.bidirectional_dijkstra(graph, a, b, weight='length')[1]
+        except nx.NetworkXNoPath:
+            path = [a, b]
+        leg = [[nodes.at[node, 'y'], nodes.at[node, 'x']] for node in path]
+        coordinates.extend(leg[1:] if coordinates else leg)
+    return coordinates
+
+def plan_walking_tour(points, nodes, edges, cache_key, cache_dir=TOUR_CACHE_DIR, workers=None):
+    """
+    Plan a walk past all points along the street network.
+
+    Points are snapped to their nearest street node, so points at the same
+    node are one stop. Returns (points in visiting order, route as [lat, lon]
+    pairs, length in metres); the route ends where it started.
+    """
+    import numpy as np
+
+    if not points:
+        return [], [], 0.0
+    graph = street_graph(nodes, edges)
+    snapped = snap_points(points, nodes)
+    stops = list(dict.fromkeys(snapped.tolist()))
+    distances = distance_matrix(graph, stops, cache_key, cache_dir, workers)
+
+    unreachable = ~np.isfinite(distances[0])
+    if unreachable.any():
+        print(f"WARNING: {int(unreachable.sum())} of {len(stops)} stops are not connected to the first one by streets; "
+              f"the tour jumps between them")
+    reachable = np.isfinite(distances)
+    # A large penalty makes the tour cross between unconnected parts as rarely as possible
+    penalty = (distances[reachable].max() if reachable.any() else 0) * 10 + 1
+    order = plan_tour(np.where(reachable, distances, penalty))
+    length = tour_length(np.where(reachable, distances, 0), order)
+
+    stop_order = {stops[i]: position for position, i in enumerate(order)}
+    ordered_points = [point for _, point in sorted(zip(snapped.tolist(), points), key=lambda item: stop_order[item[0]])]
+    print(f"Walking tour: {len(points)} points at {len(stops)} stops, {length / 1000:.1f} km")
+    return ordered_points, route_coordinates(graph, nodes, [stops[i] for i in order]), length
+
+def main(argv=None):
+    import storage
+    from street_network import load_street_network, osm_file_key
+
+    parser = argparse.ArgumentParser(description="Plan a walk past all points along the street network")
+    parser.add_argument("--osm", default='data/cologne.osm')
+    parser.add_argument("--workers", type=int, help="Number of worker processes for the shortest paths")
+    args = parser.parse_args(argv)
+
+    nodes, edges = load_street_network(args.osm)
+    points, _, _ = plan_walking_tour(storage.fetch_points(), nodes, edges, osm_file_key(args.osm),
+                                     workers=args.workers)
+    for stop, point in enumerate(points, start=1):
+        print(f"{stop:>4}. ID: {point[0]}  {point[1]}, {point[2]}  {point[3]}")
+
+if __name__ == "__main__":
+    main()